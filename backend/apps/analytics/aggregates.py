@@ -0,0 +1,150 @@
+import datetime
+
+from django.db import transaction
+from django.db.models import Max, Min, Sum, Q
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from .models import UserActivity, ActivityCube
+
+# Шаг пересчета куба активности, ограничивающий объем одной выборки
+CUBE_ROLLUP_STEP = datetime.timedelta(days=1)
+
+# Задержка построения куба: активности попадают в базу из буфера с опозданием
+CUBE_ROLLUP_LAG = datetime.timedelta(minutes=5)
+
+# Последние построенные часы, пересчитываемые повторно с учетом опоздавших записей
+CUBE_REROLL_WINDOW = datetime.timedelta(hours=2)
+
+
+def hour_start(value):
+    """Начало часа для указанного времени."""
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def day_bounds(date):
+    """Границы суток в текущем часовом поясе: начало и начало следующих суток."""
+    day_start = timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+    return day_start, day_start + datetime.timedelta(days=1)
+
+
+def get_cube_watermark():
+    """Время, до которого куб активности построен полностью."""
+    last_hour = ActivityCube.objects.aggregate(last_hour=Max('hour'))['last_hour']
+    if last_hour is None:
+        return None
+    return last_hour + datetime.timedelta(hours=1)
+
+
+def rollup_activity_cube(now=None):
+    """Инкрементальное построение куба активности по завершенным часам.
+
+    Пересчитываются часы после последнего заполненного часа куба и последние
+    CUBE_REROLL_WINDOW уже построенных часов, куда могли опоздать записи из
+    буфера. Час строится не раньше чем через CUBE_ROLLUP_LAG после его конца.
+    Каждый шаг заменяет строки куба целиком, поэтому повторный запуск безопасен.
+    """
+    end = hour_start((now or timezone.now()) - CUBE_ROLLUP_LAG)
+
+    start = get_cube_watermark()
+    if start is not None:
+        start -= CUBE_REROLL_WINDOW
+    else:
+        first = UserActivity.objects.aggregate(first=Min('created_at'))['first']
+        if first is None:
+            return 0
+        start = hour_start(first)
+
+    created = 0
+    while start < end:
+        step_end = min(start + CUBE_ROLLUP_STEP, end)
+
+        rows = UserActivity.objects.filter(
+            created_at__gte=start,
+            created_at__lt=step_end
+        ).annotate(
+            hour=TruncHour('created_at')
+        ).values(
+            'hour', 'activity_type', 'user__department_id', 'user__specialization_id'
+        ).annotate(count=Sum('sample_weight')).order_by()
+
+        cube = [
+            ActivityCube(
+                hour=row['hour'],
+                activity_type=row['activity_type'],
+                department_id=row['user__department_id'],
+                specialization_id=row['user__specialization_id'],
+                count=row['count']
+            )
+            for row in rows
+        ]
+
+        with transaction.atomic():
+            ActivityCube.objects.filter(hour__gte=start, hour__lt=step_end).delete()
+            ActivityCube.objects.bulk_create(cube, batch_size=1000)
+
+        created += len(cube)
+        start = step_end
+
+    return created
+
+
+def daily_activity_counts(activity_type=None, start_date=None, end_date=None,
+                          department_id=None, specialization_id=None):
+    """Количество активностей по дням и типам.
+
+    Завершенные часы читаются из куба активности, а исходные записи
+    используются только для часов, которые еще не попали в куб.
+    """
+    cube_query = Q()
+    raw_query = Q()
+
+    if activity_type:
+        cube_query &= Q(activity_type=activity_type)
+        raw_query &= Q(activity_type=activity_type)
+
+    # Сравнение с границами суток, а не по дате, позволяет использовать индексы
+    if start_date:
+        range_start, _ = day_bounds(start_date)
+        cube_query &= Q(hour__gte=range_start)
+        raw_query &= Q(created_at__gte=range_start)
+
+    if end_date:
+        _, range_end = day_bounds(end_date)
+        cube_query &= Q(hour__lt=range_end)
+        raw_query &= Q(created_at__lt=range_end)
+
+    if department_id:
+        cube_query &= Q(department_id=department_id)
+        raw_query &= Q(user__department__id=department_id)
+
+    if specialization_id:
+        cube_query &= Q(specialization_id=specialization_id)
+        raw_query &= Q(user__specialization__id=specialization_id)
+
+    watermark = get_cube_watermark()
+
+    counts = {}
+    if watermark is not None:
+        cube_data = ActivityCube.objects.filter(cube_query, hour__lt=watermark).annotate(
+            day=TruncDate('hour')
+        ).values('day', 'activity_type').annotate(total=Sum('count')).order_by()
+
+        for item in cube_data:
+            key = (item['day'], item['activity_type'])
+            counts[key] = counts.get(key, 0) + item['total']
+
+        raw_query &= Q(created_at__gte=watermark)
+
+    raw_data = UserActivity.objects.filter(raw_query).annotate(
+        day=TruncDate('created_at')
+    ).values('day', 'activity_type').annotate(total=Sum('sample_weight')).order_by()
+
+    for item in raw_data:
+        key = (item['day'], item['activity_type'])
+        counts[key] = counts.get(key, 0) + item['total']
+
+    return [
+        {'day': day, 'activity_type': item_type, 'count': count}
+        for (day, item_type), count in sorted(counts.items())
+    ]
@@ -0,0 +1,290 @@
+import csv
+import datetime
+import gzip
+import hashlib
+import io
+import re
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.file_management.models import FileDownloadHistory
+from apps.news.models import NewsView
+from .export import Echo, iter_rows
+from .models import AnalyticsArchive, PageView
+
+# Срок хранения сырых данных в базе (дней)
+ARCHIVE_RETENTION_DAYS = 90
+
+# Максимальное количество суток, архивируемых за один запуск по каждому источнику
+ARCHIVE_MAX_DAYS_PER_RUN = 7
+
+# Размер порции при удалении заархивированных строк
+ARCHIVE_DELETE_BATCH_SIZE = 5000
+
+# Размер порции при загрузке архива во временную таблицу
+REHYDRATE_BATCH_SIZE = 5000
+
+# Шаблон пути к файлу архива
+ARCHIVE_PATH = 'archives/analytics/{source}/{date:%Y}/{date:%m}/{date:%d}.csv.gz'
+
+# Шаблон пути к дополнительному файлу со строками, появившимися после архивации суток
+ARCHIVE_PART_PATH = 'archives/analytics/{source}/{date:%Y}/{date:%m}/{date:%d}.{part}.csv.gz'
+
+# Источники архивации: модель, поле времени и колонки
+# в формате выгрузки (заголовок, поле для values_list, тип)
+ARCHIVE_SOURCES = {
+    AnalyticsArchive.Source.PAGE_VIEW: {
+        'model': PageView,
+        'time_field': 'viewed_at',
+        'columns': [
+            ('id', 'id', 'string'),
+            ('user_id', 'user_id', 'string'),
+            ('url', 'url__url', 'string'),
+            ('path', 'path__url', 'string'),
+            ('referer', 'referer__url', 'string'),
+            ('ip_address', 'ip_address', 'string'),
+            ('user_agent', 'user_agent__user_agent', 'string'),
+            ('browser', 'browser', 'string'),
+            ('os', 'os', 'string'),
+            ('device', 'device', 'string'),
+            ('session_id', 'session_id', 'string'),
+            ('sample_weight', 'sample_weight', 'integer'),
+            ('viewed_at', 'viewed_at', 'datetime'),
+        ],
+    },
+    AnalyticsArchive.Source.NEWS_VIEW: {
+        'model': NewsView,
+        'time_field': 'viewed_at',
+        'columns': [
+            ('id', 'id', 'integer'),
+            ('article_id', 'article_id', 'string'),
+            ('user_id', 'user_id', 'string'),
+            ('ip_address', 'ip_address', 'string'),
+            ('user_agent', 'user_agent', 'string'),
+            ('viewed_at', 'viewed_at', 'datetime'),
+        ],
+    },
+    AnalyticsArchive.Source.FILE_DOWNLOAD: {
+        'model': FileDownloadHistory,
+        'time_field': 'downloaded_at',
+        'columns': [
+            ('id', 'id', 'integer'),
+            ('file_id', 'file_id', 'string'),
+            ('user_id', 'user_id', 'string'),
+            ('ip_address', 'ip_address', 'string'),
+            ('user_agent', 'user_agent', 'string'),
+            ('downloaded_at', 'downloaded_at', 'datetime'),
+        ],
+    },
+}
+
+# Типы колонок временной таблицы
+SCRATCH_COLUMN_TYPES = {
+    'string': 'text',
+    'integer': 'bigint',
+    'datetime': 'timestamp with time zone',
+}
+
+SCRATCH_TABLE_RE = re.compile(r'^[a-z_][a-z0-9_]{0,62}$')
+
+
+def _day_bounds(date):
+    """Границы суток в текущем часовом поясе."""
+    day_start = timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+    return day_start, day_start + datetime.timedelta(days=1)
+
+
+def _day_queryset(source, date):
+    """Строки источника за указанные сутки."""
+    config = ARCHIVE_SOURCES[source]
+    day_start, day_end = _day_bounds(date)
+    return config['model'].objects.filter(**{
+        f"{config['time_field']}__gte": day_start,
+        f"{config['time_field']}__lt": day_end,
+    })
+
+
+def _file_checksum(path):
+    """Контрольная сумма SHA-256 файла в хранилище."""
+    digest = hashlib.sha256()
+    with default_storage.open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _delete_rows(model, pks):
+    """Удаление строк по списку ключей порциями ограниченного размера."""
+    deleted = 0
+    for i in range(0, len(pks), ARCHIVE_DELETE_BATCH_SIZE):
+        with transaction.atomic():
+            deleted += model.objects.filter(pk__in=pks[i:i + ARCHIVE_DELETE_BATCH_SIZE]).delete()[0]
+    return deleted
+
+
+def _write_archive(config, pks, output):
+    """Запись строк с указанными ключами в сжатый CSV."""
+    model = config['model']
+    writer = csv.writer(Echo())
+
+    with gzip.GzipFile(fileobj=output, mode='wb') as compressed:
+        compressed.write(writer.writerow([header for header, _, _ in config['columns']]).encode('utf-8'))
+        for i in range(0, len(pks), ARCHIVE_DELETE_BATCH_SIZE):
+            rows = model.objects.filter(
+                pk__in=pks[i:i + ARCHIVE_DELETE_BATCH_SIZE]
+            ).order_by(config['time_field'], 'pk')
+            for row in iter_rows(rows, config['columns']):
+                compressed.write(writer.writerow(row).encode('utf-8'))
+
+
+def archive_day(source, date):
+    """Архивация сырых данных источника за сутки.
+
+    Ключи строк фиксируются до записи, поэтому удаляются только строки,
+    попавшие в архив. Строки записываются в сжатый CSV, файл сохраняется
+    в хранилище, его контрольная сумма проверяется повторным чтением,
+    после чего создается запись манифеста и строки удаляются порциями.
+    Если за эти сутки архив уже есть, строки, появившиеся после него
+    (например, из буфера), записываются в дополнительную часть.
+    """
+    config = ARCHIVE_SOURCES[source]
+    pks = list(
+        _day_queryset(source, date).order_by(config['time_field'], 'pk').values_list('pk', flat=True)
+    )
+
+    last = AnalyticsArchive.objects.filter(source=source, date=date).order_by('-part').first()
+    if not pks:
+        return last, 0
+
+    part = 0 if last is None else last.part + 1
+    if part:
+        path = ARCHIVE_PART_PATH.format(source=source, date=date, part=part)
+    else:
+        path = ARCHIVE_PATH.format(source=source, date=date)
+
+    digest = hashlib.sha256()
+    with tempfile.TemporaryFile() as output:
+        _write_archive(config, pks, output)
+
+        output.seek(0)
+        for chunk in iter(lambda: output.read(1024 * 1024), b''):
+            digest.update(chunk)
+        file_size = output.tell()
+
+        # Файл без манифеста остался от прерванного запуска
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        output.seek(0)
+        saved_path = default_storage.save(path, File(output))
+
+    checksum = digest.hexdigest()
+    if _file_checksum(saved_path) != checksum:
+        default_storage.delete(saved_path)
+        raise IOError(f"Контрольная сумма архива {saved_path} не совпадает")
+
+    archive = AnalyticsArchive.objects.create(
+        source=source,
+        date=date,
+        part=part,
+        file_path=saved_path,
+        row_count=len(pks),
+        file_size=file_size,
+        checksum=checksum
+    )
+
+    deleted = _delete_rows(config['model'], pks)
+    return archive, deleted
+
+
+def archive_expired_analytics(now=None, retention_days=ARCHIVE_RETENTION_DAYS):
+    """Архивация закрытых суток старше срока хранения по всем источникам."""
+    cutoff = timezone.localdate(now or timezone.now()) - datetime.timedelta(days=retention_days)
+    cutoff_start, _ = _day_bounds(cutoff)
+    result = {}
+
+    for source, config in ARCHIVE_SOURCES.items():
+        archived = []
+        for _ in range(ARCHIVE_MAX_DAYS_PER_RUN):
+            oldest = config['model'].objects.filter(**{
+                f"{config['time_field']}__lt": cutoff_start
+            }).order_by(config['time_field']).values_list(config['time_field'], flat=True).first()
+            if oldest is None:
+                break
+
+            date = timezone.localtime(oldest).date()
+            archive, deleted = archive_day(source, date)
+            archived.append({'date': date.isoformat(), 'rows': archive.row_count, 'deleted': deleted})
+
+        result[str(source)] = archived
+
+    return result
+
+
+def _read_archive_rows(archive, columns):
+    """Чтение строк файла архива с приведением пустых значений к NULL."""
+    if _file_checksum(archive.file_path) != archive.checksum:
+        raise IOError(f"Контрольная сумма архива {archive.file_path} не совпадает")
+
+    with default_storage.open(archive.file_path, 'rb') as f:
+        with gzip.GzipFile(fileobj=f, mode='rb') as compressed:
+            reader = csv.reader(io.TextIOWrapper(compressed, encoding='utf-8', newline=''))
+            next(reader, None)
+            for row in reader:
+                yield [value if value != '' else None for value in row[:len(columns)]]
+
+
+def rehydrate_range(source, start_date, end_date, table_name=None):
+    """Загрузка архивов источника за период во временную таблицу.
+
+    Таблица создается заново с колонками архива и не связана с моделями,
+    поэтому ее можно удалить после расследования без последствий.
+    """
+    config = ARCHIVE_SOURCES[source]
+    columns = config['columns']
+
+    if table_name is None:
+        table_name = f"analytics_rehydrated_{source}_{timezone.now().strftime('%Y%m%d%H%M%S')}"
+    if not SCRATCH_TABLE_RE.match(table_name):
+        raise ValueError(f"Недопустимое имя таблицы: {table_name}")
+
+    archives = AnalyticsArchive.objects.filter(
+        source=source,
+        date__gte=start_date,
+        date__lte=end_date
+    ).order_by('date', 'part')
+
+    quote = connection.ops.quote_name
+    column_sql = ', '.join(
+        f"{quote(header)} {SCRATCH_COLUMN_TYPES[kind]}" for header, _, kind in columns
+    )
+    insert_sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(table_name),
+        ', '.join(quote(header) for header, _, _ in columns),
+        ', '.join(['%s'] * len(columns))
+    )
+
+    row_count = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {quote(table_name)} ({column_sql})")
+
+        for archive in archives:
+            batch = []
+            for row in _read_archive_rows(archive, columns):
+                batch.append(row)
+                if len(batch) >= REHYDRATE_BATCH_SIZE:
+                    cursor.executemany(insert_sql, batch)
+                    row_count += len(batch)
+                    batch = []
+            if batch:
+                cursor.executemany(insert_sql, batch)
+                row_count += len(batch)
+
+    return {
+        'table': table_name,
+        'archives': len(archives),
+        'rows': row_count
+    }
@@ -0,0 +1,130 @@
+import datetime
+import json
+import logging
+import uuid
+
+from django.db import InterfaceError, OperationalError
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from .dimensions import get_user_agent_id
+from .models import UserActivity
+
+logger = logging.getLogger('app')
+
+# Список Redis с активностями, ожидающими записи в базу
+ACTIVITY_BUFFER_KEY = 'analytics:activity_buffer'
+
+# Количество активностей, записываемых за одну вставку
+ACTIVITY_FLUSH_BATCH_SIZE = 1000
+
+# Максимальное количество вставок за один запуск сброса буфера
+ACTIVITY_FLUSH_MAX_BATCHES = 50
+
+# Список Redis с записями, которые не удалось сохранить даже по одной
+ACTIVITY_DEAD_LETTER_KEY = 'analytics:activity_dead_letter'
+
+# Максимальное количество хранимых непринятых записей
+ACTIVITY_DEAD_LETTER_MAX = 10000
+
+
+def enqueue_activity(user_id, activity_type, ip_address='', user_agent='',
+                     content_type='', object_id='', description='', sample_weight=1):
+    """Постановка активности в буфер для пакетной записи."""
+    record = {
+        'id': str(uuid.uuid4()),
+        'user_id': str(user_id),
+        'activity_type': activity_type,
+        'description': description,
+        'ip_address': ip_address or None,
+        'user_agent': user_agent,
+        'content_type': content_type,
+        'object_id': str(object_id),
+        'sample_weight': sample_weight,
+        'created_at': timezone.now().isoformat(),
+    }
+
+    try:
+        get_redis_connection('default').rpush(ACTIVITY_BUFFER_KEY, json.dumps(record))
+    except Exception as e:
+        logger.warning(f"Не удалось поставить активность в буфер: {e}")
+
+
+def _take_batch(connection, size):
+    """Атомарное извлечение порции записей из начала буфера."""
+    pipe = connection.pipeline(transaction=True)
+    pipe.lrange(ACTIVITY_BUFFER_KEY, 0, size - 1)
+    pipe.ltrim(ACTIVITY_BUFFER_KEY, size, -1)
+    return pipe.execute()[0]
+
+
+def _build_activity(record):
+    """Создание объекта активности из записи буфера."""
+    return UserActivity(
+        id=record['id'],
+        user_id=record['user_id'],
+        activity_type=record['activity_type'],
+        description=record['description'],
+        ip_address=record['ip_address'],
+        user_agent_id=get_user_agent_id(record['user_agent']),
+        content_type=record['content_type'],
+        object_id=record['object_id'],
+        sample_weight=record['sample_weight'],
+        created_at=datetime.datetime.fromisoformat(record['created_at']),
+    )
+
+
+def _write_batch(items, dead_letters):
+    """Запись порции активностей с поиском непринимаемых записей.
+
+    Если порция не записывается целиком, она делится пополам, пока
+    ошибочные записи не останутся по одной; такие записи добавляются
+    в dead_letters. Ошибки соединения с базой пробрасываются, так как
+    не связаны с содержимым записей.
+    """
+    try:
+        activities = [_build_activity(json.loads(item)) for item in items]
+        # Записи с id, уже сохраненным при прерванном сбросе, пропускаются
+        UserActivity.objects.bulk_create(activities, ignore_conflicts=True)
+        return len(activities)
+    except (InterfaceError, OperationalError):
+        raise
+    except Exception as e:
+        if len(items) == 1:
+            logger.warning(f"Активность из буфера не записана и отложена: {e}")
+            dead_letters.append(items[0])
+            return 0
+
+    middle = len(items) // 2
+    return _write_batch(items[:middle], dead_letters) + _write_batch(items[middle:], dead_letters)
+
+
+def flush_activity_buffer():
+    """Запись накопленных в буфере активностей в базу пакетами.
+
+    Если база недоступна, порция возвращается в начало буфера, чтобы
+    повторить ее при следующем запуске. Записи, которые база не принимает,
+    переносятся в отдельный список и не задерживают остальные.
+    """
+    connection = get_redis_connection('default')
+    written = 0
+
+    for _ in range(ACTIVITY_FLUSH_MAX_BATCHES):
+        items = _take_batch(connection, ACTIVITY_FLUSH_BATCH_SIZE)
+        if not items:
+            break
+
+        dead_letters = []
+        try:
+            written += _write_batch(items, dead_letters)
+        except Exception:
+            connection.lpush(ACTIVITY_BUFFER_KEY, *reversed(items))
+            raise
+
+        if dead_letters:
+            pipe = connection.pipeline(transaction=True)
+            pipe.rpush(ACTIVITY_DEAD_LETTER_KEY, *dead_letters)
+            pipe.ltrim(ACTIVITY_DEAD_LETTER_KEY, -ACTIVITY_DEAD_LETTER_MAX, -1)
+            pipe.execute()
+
+    return written
@@ -0,0 +1,178 @@
+import datetime
+import hashlib
+import json
+
+import numpy as np
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import UserActivity
+
+# Время хранения рассчитанных отчетов в кэше (сек)
+COHORT_CACHE_TIMEOUT = 60 * 60
+
+# Время, в течение которого повторный запрос не ставит задачу заново (сек)
+COHORT_PENDING_TIMEOUT = 10 * 60
+
+# Размер порции при потоковом чтении активностей
+COHORT_CHUNK_SIZE = 10000
+
+WEEK_SECONDS = 7 * 24 * 60 * 60
+
+# Коды событий в массивах
+LOGIN, TEST_START, TEST_COMPLETE = 0, 1, 2
+
+EVENT_CODES = {
+    UserActivity.ActivityType.LOGIN: LOGIN,
+    UserActivity.ActivityType.TEST_START: TEST_START,
+    UserActivity.ActivityType.TEST_COMPLETE: TEST_COMPLETE,
+}
+
+# Значение "события не было" для поэлементного минимума
+NEVER = np.iinfo(np.int64).max
+
+
+def report_cache_key(kind, params):
+    """Ключ кэша отчета для набора параметров."""
+    digest = hashlib.md5(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+    return f"analytics:{kind}:{digest}"
+
+
+def _week_start(date):
+    """Начало недели (понедельник) в текущем часовом поясе."""
+    monday = date - datetime.timedelta(days=date.weekday())
+    return timezone.make_aware(datetime.datetime.combine(monday, datetime.time.min))
+
+
+def load_activity_arrays(start, end):
+    """Потоковая загрузка активностей в массивы NumPy.
+
+    Возвращает массивы кодов пользователей, кодов событий и времени событий
+    (секунды с начала эпохи), а также количество различных пользователей.
+    """
+    rows = UserActivity.objects.filter(
+        activity_type__in=list(EVENT_CODES),
+        created_at__gte=start,
+        created_at__lt=end
+    ).values_list('user_id', 'activity_type', 'created_at').order_by().iterator(chunk_size=COHORT_CHUNK_SIZE)
+
+    user_codes = {}
+    users, events, times = [], [], []
+    chunk_users, chunk_events, chunk_times = [], [], []
+
+    for user_id, activity_type, created_at in rows:
+        chunk_users.append(user_codes.setdefault(user_id, len(user_codes)))
+        chunk_events.append(EVENT_CODES[activity_type])
+        chunk_times.append(int(created_at.timestamp()))
+
+        if len(chunk_users) >= COHORT_CHUNK_SIZE:
+            users.append(np.array(chunk_users, dtype=np.int64))
+            events.append(np.array(chunk_events, dtype=np.int8))
+            times.append(np.array(chunk_times, dtype=np.int64))
+            chunk_users, chunk_events, chunk_times = [], [], []
+
+    users.append(np.array(chunk_users, dtype=np.int64))
+    events.append(np.array(chunk_events, dtype=np.int8))
+    times.append(np.array(chunk_times, dtype=np.int64))
+
+    return np.concatenate(users), np.concatenate(events), np.concatenate(times), len(user_codes)
+
+
+def _first_event_after(users, values, mask, threshold, user_count):
+    """Первое значение события для каждого пользователя не раньше порога пользователя."""
+    first = np.full(user_count, NEVER, dtype=np.int64)
+    selected = mask & (values >= threshold[users])
+    np.minimum.at(first, users[selected], values[selected])
+    return first
+
+
+def build_cohorts(start_date, end_date, periods):
+    """Построение матриц удержания по недельным когортам входа.
+
+    Для когорты недели N ячейка k содержит количество пользователей,
+    начавших (завершивших) тест к концу недели N+k.
+    """
+    start = _week_start(start_date)
+    weeks = (end_date - start.date()).days // 7 + 1
+    end = start + datetime.timedelta(weeks=weeks + periods)
+
+    users, events, times, user_count = load_activity_arrays(start, end)
+    week = (times - int(start.timestamp())) // WEEK_SECONDS
+
+    # Когорта пользователя - неделя его первого входа
+    cohort = np.full(user_count, NEVER, dtype=np.int64)
+    logins = events == LOGIN
+    np.minimum.at(cohort, users[logins], week[logins])
+    in_cohort = cohort < weeks
+
+    cohort_sizes = np.bincount(cohort[in_cohort], minlength=weeks)
+
+    first_start = _first_event_after(users, week, events == TEST_START, cohort, user_count)
+    first_complete = _first_event_after(users, week, events == TEST_COMPLETE, first_start, user_count)
+
+    matrices = {}
+    for name, first in [('started', first_start), ('completed', first_complete)]:
+        matrix = np.zeros((weeks, periods + 1), dtype=np.int64)
+        offset = first - cohort
+        selected = in_cohort & (first != NEVER) & (offset <= periods)
+        np.add.at(matrix, (cohort[selected], offset[selected]), 1)
+        matrices[name] = np.cumsum(matrix, axis=1)
+
+    return {
+        'periods': periods,
+        'cohorts': [
+            {
+                'week_start': (start + datetime.timedelta(weeks=index)).date().isoformat(),
+                'users': int(cohort_sizes[index]),
+                'started': matrices['started'][index].tolist(),
+                'completed': matrices['completed'][index].tolist()
+            }
+            for index in range(weeks)
+        ]
+    }
+
+
+def build_funnel(start_date, end_date):
+    """Воронка вход -> начало теста -> завершение теста за период."""
+    start = timezone.make_aware(datetime.datetime.combine(start_date, datetime.time.min))
+    end = timezone.make_aware(datetime.datetime.combine(end_date, datetime.time.min)) + datetime.timedelta(days=1)
+
+    users, events, times, user_count = load_activity_arrays(start, end)
+
+    first_login = np.full(user_count, NEVER, dtype=np.int64)
+    logins = events == LOGIN
+    np.minimum.at(first_login, users[logins], times[logins])
+
+    first_start = _first_event_after(users, times, events == TEST_START, first_login, user_count)
+    first_complete = _first_event_after(users, times, events == TEST_COMPLETE, first_start, user_count)
+
+    logged_in = int(np.count_nonzero(first_login != NEVER))
+    started = int(np.count_nonzero((first_login != NEVER) & (first_start != NEVER)))
+    completed = int(np.count_nonzero((first_start != NEVER) & (first_complete != NEVER)))
+
+    return {
+        'steps': [
+            {'step': UserActivity.ActivityType.LOGIN, 'users': logged_in},
+            {'step': UserActivity.ActivityType.TEST_START, 'users': started},
+            {'step': UserActivity.ActivityType.TEST_COMPLETE, 'users': completed},
+        ]
+    }
+
+
+def get_or_schedule_report(kind, params):
+    """Получение отчета из кэша или постановка задачи на его расчет.
+
+    Возвращает готовый отчет или None, если расчет еще выполняется.
+    """
+    from .tasks import compute_cohort_report
+
+    cache_key = report_cache_key(kind, params)
+    report = cache.get(cache_key)
+    if report is not None:
+        return report
+
+    # Ставим задачу только один раз на набор параметров
+    if cache.add(f"{cache_key}:pending", True, COHORT_PENDING_TIMEOUT):
+        compute_cohort_report.delay(kind, params)
+
+    return None
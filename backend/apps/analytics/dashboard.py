@@ -0,0 +1,156 @@
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Avg, Sum
+from django.utils import timezone
+
+from .ingestion import get_filtered_totals
+from .models import DailyStatistics, PopularPage
+from .serializers import DailyStatisticsSerializer
+from .summary import get_user_statistics_summary
+
+# Ключ закэшированного дашборда для периода
+DASHBOARD_CACHE_KEY = 'analytics:dashboard:{days}'
+
+# Ключ версии данных: меняется после каждого пересчета агрегатов
+DASHBOARD_VERSION_KEY = 'analytics:dashboard:version'
+
+# Ключ блокировки пересчета дашборда для периода
+DASHBOARD_LOCK_KEY = 'analytics:dashboard:{days}:lock'
+
+# Время, в течение которого данные считаются свежими (сек)
+DASHBOARD_FRESH_SECONDS = 5 * 60
+
+# Время хранения данных в кэше: устаревшие данные отдаются, пока идет пересчет (сек)
+DASHBOARD_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Время жизни блокировки на случай падения пересчета (сек)
+DASHBOARD_LOCK_TIMEOUT = 2 * 60
+
+# Ожидание результата чужого пересчета при пустом кэше (сек)
+DASHBOARD_WAIT_SECONDS = 10
+DASHBOARD_WAIT_INTERVAL = 0.2
+
+
+def build_dashboard(days=30):
+    """Расчет данных дашборда за последние дни."""
+    end_date = timezone.now().date()
+    start_date = end_date - timedelta(days=days - 1)
+
+    # Получаем ежедневную статистику
+    daily_stats = DailyStatistics.objects.filter(
+        date__gte=start_date,
+        date__lte=end_date
+    ).order_by('date')
+
+    # Получаем пользовательскую статистику со всеми разрезами
+    user_summary = get_user_statistics_summary()
+
+    # Получаем популярные страницы
+    popular_pages = PopularPage.objects.filter(
+        date__gte=start_date,
+        date__lte=end_date
+    ).values('url', 'title').annotate(
+        total_views=Sum('views_count')
+    ).order_by('-total_views')[:5]
+
+    # Формируем сводные данные
+    summary = daily_stats.aggregate(
+        total_views=Sum('total_views'),
+        unique_visitors=Sum('unique_visitors'),
+        new_users=Sum('new_users'),
+        average_session_duration=Avg('average_session_duration'),
+        files_uploaded=Sum('files_uploaded'),
+        files_downloaded=Sum('files_downloaded'),
+        tests_started=Sum('tests_started'),
+        tests_completed=Sum('tests_completed')
+    )
+
+    # Отброшенные при записи события роботов и мониторинга
+    try:
+        filtered_events = get_filtered_totals(days=days)
+    except Exception:
+        filtered_events = None
+
+    return {
+        'summary': summary,
+        'daily_stats': list(DailyStatisticsSerializer(daily_stats, many=True).data),
+        'popular_pages': list(popular_pages),
+        'active_users': user_summary['total_users'],
+        'users_by_role': user_summary['users_by_role'],
+        'users_by_department': user_summary['users_by_department'],
+        'filtered_events': filtered_events,
+        'period': {
+            'start_date': start_date.strftime('%Y-%m-%d'),
+            'end_date': end_date.strftime('%Y-%m-%d'),
+            'days': days
+        }
+    }
+
+
+def refresh_dashboard(days=30):
+    """Пересчет дашборда и сохранение в кэш с текущей версией данных."""
+    version = cache.get(DASHBOARD_VERSION_KEY)
+    payload = build_dashboard(days)
+    cache.set(DASHBOARD_CACHE_KEY.format(days=days), {
+        'payload': payload,
+        'version': version,
+        'computed_at': time.time()
+    }, DASHBOARD_CACHE_TIMEOUT)
+    return payload
+
+
+def invalidate_dashboard():
+    """Пометка всех закэшированных дашбордов как устаревших.
+
+    Данные не удаляются, чтобы их можно было отдавать до окончания пересчета.
+    """
+    cache.set(DASHBOARD_VERSION_KEY, time.time(), None)
+
+
+def _is_fresh(entry, version):
+    """Проверка, что данные посчитаны по текущей версии и не истекли."""
+    return (
+        entry['version'] == version
+        and time.time() - entry['computed_at'] < DASHBOARD_FRESH_SECONDS
+    )
+
+
+def get_dashboard(days=30):
+    """Получение дашборда по схеме stale-while-revalidate.
+
+    Свежие данные отдаются из кэша. Устаревшие данные тоже отдаются сразу,
+    а пересчет ставится в фон одним процессом под блокировкой. При пустом
+    кэше пересчет выполняет только получивший блокировку запрос, остальные
+    ждут его результата.
+    """
+    from .tasks import refresh_dashboard_cache
+
+    cache_key = DASHBOARD_CACHE_KEY.format(days=days)
+    lock_key = DASHBOARD_LOCK_KEY.format(days=days)
+
+    cached = cache.get_many([cache_key, DASHBOARD_VERSION_KEY])
+    entry = cached.get(cache_key)
+    version = cached.get(DASHBOARD_VERSION_KEY)
+
+    if entry is not None:
+        if not _is_fresh(entry, version) and cache.add(lock_key, True, DASHBOARD_LOCK_TIMEOUT):
+            refresh_dashboard_cache.delay(days)
+        return entry['payload']
+
+    if cache.add(lock_key, True, DASHBOARD_LOCK_TIMEOUT):
+        try:
+            return refresh_dashboard(days)
+        finally:
+            cache.delete(lock_key)
+
+    # Пересчет уже выполняется другим запросом
+    deadline = time.monotonic() + DASHBOARD_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(DASHBOARD_WAIT_INTERVAL)
+        entry = cache.get(cache_key)
+        if entry is not None:
+            return entry['payload']
+
+    return build_dashboard(days)
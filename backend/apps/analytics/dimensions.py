@@ -0,0 +1,80 @@
+from collections import OrderedDict
+
+from django.db import transaction
+
+from .user_agents import parse_user_agent
+
+# Размер кэша идентификаторов справочников в памяти процесса.
+# Различных URL и User-Agent в системе несколько тысяч,
+# поэтому почти все обращения обслуживаются без запросов к БД.
+DIMENSION_CACHE_SIZE = 8192
+
+# Максимальная длина значения URL в справочнике.
+URL_MAX_LENGTH = 255
+
+# Идентификаторы справочников в памяти процесса: значение -> id
+_user_agent_ids = OrderedDict()
+_page_url_ids = OrderedDict()
+
+
+def _remember_id(cache, key, value):
+    """Сохранение идентификатора с вытеснением самых старых записей."""
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > DIMENSION_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def _cached_id(cache, key, load):
+    """Идентификатор из кэша процесса или из базы данных.
+
+    Записи справочников никогда не удаляются, но запись, созданная
+    в откатившейся транзакции, не существует. Поэтому найденный в базе
+    идентификатор попадает в кэш только после фиксации транзакции.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    value = load()
+    transaction.on_commit(lambda: _remember_id(cache, key, value))
+    return value
+
+
+def get_user_agent_id(user_agent):
+    """Получение суррогатного ключа строки User-Agent."""
+    from .models import UserAgent
+
+    if not user_agent:
+        return None
+
+    def load():
+        parsed = parse_user_agent(user_agent)
+        agent, _ = UserAgent.objects.get_or_create(
+            user_agent_hash=UserAgent.make_hash(user_agent),
+            defaults={
+                'user_agent': user_agent,
+                'browser': parsed.browser,
+                'os': parsed.os,
+                'device': parsed.device,
+            }
+        )
+        return agent.id
+
+    return _cached_id(_user_agent_ids, user_agent, load)
+
+
+def get_page_url_id(url):
+    """Получение суррогатного ключа URL."""
+    from .models import PageUrl
+
+    if not url:
+        return None
+
+    url = url[:URL_MAX_LENGTH]
+
+    def load():
+        page_url, _ = PageUrl.objects.get_or_create(url=url)
+        return page_url.id
+
+    return _cached_id(_page_url_ids, url, load)
@@ -0,0 +1,133 @@
+import csv
+import tempfile
+import uuid
+
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+# Размер порции, читаемой из серверного курсора PostgreSQL
+EXPORT_CHUNK_SIZE = 5000
+
+# Количество строк в одной группе строк файла Parquet
+PARQUET_ROW_GROUP_SIZE = 50000
+
+# Поддерживаемые форматы выгрузки
+EXPORT_FORMATS = ['csv', 'parquet']
+
+
+class Echo:
+    """Псевдобуфер, возвращающий записанное значение вместо хранения."""
+
+    def write(self, value):
+        return value
+
+
+def _export_value(value):
+    """Приведение значения к типу, поддерживаемому форматами выгрузки."""
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def iter_rows(queryset, columns):
+    """Потоковое чтение строк выгрузки порциями через серверный курсор."""
+    lookups = [lookup for _, lookup, _ in columns]
+    for row in queryset.values_list(*lookups).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield [_export_value(value) for value in row]
+
+
+def stream_csv(queryset, columns):
+    """Генератор строк CSV без накопления данных в памяти."""
+    writer = csv.writer(Echo())
+    yield writer.writerow([header for header, _, _ in columns])
+    for row in iter_rows(queryset, columns):
+        yield writer.writerow(row)
+
+
+def csv_response(queryset, columns, filename):
+    """Потоковый ответ с выгрузкой в формате CSV."""
+    response = StreamingHttpResponse(stream_csv(queryset, columns), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+def write_parquet(queryset, columns, output):
+    """Запись выгрузки в файл Parquet группами строк.
+
+    В памяти одновременно находится не больше одной группы строк.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {
+        'string': pa.string(),
+        'integer': pa.int64(),
+        'datetime': pa.timestamp('us', tz='UTC'),
+    }
+    schema = pa.schema([(header, types[kind]) for header, _, kind in columns])
+
+    writer = pq.ParquetWriter(output, schema, compression='snappy')
+    try:
+        batch = []
+        for row in iter_rows(queryset, columns):
+            batch.append(row)
+            if len(batch) >= PARQUET_ROW_GROUP_SIZE:
+                writer.write_table(pa.Table.from_pylist(
+                    [dict(zip(schema.names, item)) for item in batch], schema=schema
+                ))
+                batch = []
+
+        if batch:
+            writer.write_table(pa.Table.from_pylist(
+                [dict(zip(schema.names, item)) for item in batch], schema=schema
+            ))
+    finally:
+        writer.close()
+
+
+def parquet_response(queryset, columns, filename):
+    """Ответ с выгрузкой в формате Parquet из временного файла."""
+    output = tempfile.TemporaryFile()
+    write_parquet(queryset, columns, output)
+    output.seek(0)
+    return FileResponse(output, as_attachment=True, filename=f"{filename}.parquet")
+
+
+class ExportMixin:
+    """Примесь для потоковой выгрузки записей представления.
+
+    Колонки задаются атрибутом export_columns как кортежи
+    (заголовок, поле для values_list, тип: string/integer/datetime).
+    """
+
+    export_columns = []
+    export_filename = 'export'
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Выгрузка отфильтрованных записей в CSV или Parquet."""
+        # Параметр format зарезервирован DRF для выбора рендерера
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'error': _('Неподдерживаемый формат выгрузки.')},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = self.filter_queryset(self.get_queryset())
+        filename = f"{self.export_filename}_{timezone.now().strftime('%Y%m%d_%H%M%S')}"
+
+        if export_format == 'parquet':
+            try:
+                return parquet_response(queryset, self.export_columns, filename)
+            except ImportError:
+                return Response(
+                    {'error': _('Выгрузка в Parquet недоступна: не установлен pyarrow.')},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        return csv_response(queryset, self.export_columns, filename)
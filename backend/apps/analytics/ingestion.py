@@ -0,0 +1,150 @@
+import datetime
+import ipaddress
+import logging
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from core.utils import get_client_ip
+from .user_agents import parse_user_agent
+
+logger = logging.getLogger('app')
+
+# Причины отбрасывания событий
+FILTER_BOT = 'bot'
+FILTER_IP = 'ip'
+FILTER_RATE = 'rate'
+FILTER_REASONS = [FILTER_BOT, FILTER_IP, FILTER_RATE]
+
+# Суточный счетчик отброшенных событий по причине
+FILTERED_KEY = 'analytics:filtered:{date}:{reason}'
+
+# Время хранения суточных счетчиков (сек)
+FILTERED_TTL = 35 * 24 * 60 * 60
+
+# Поминутный счетчик событий сессии
+SESSION_RATE_KEY = 'analytics:rate:{minute}:{session}'
+
+
+@lru_cache(maxsize=1)
+def _networks(allowlist, denylist):
+    """Разбор таблиц сетей из настроек один раз на процесс."""
+    def parse(cidrs):
+        networks = []
+        for cidr in cidrs:
+            try:
+                networks.append(ipaddress.ip_network(cidr, strict=False))
+            except ValueError:
+                logger.warning(f"Некорректная сеть в настройках аналитики: {cidr}")
+        return tuple(networks)
+
+    return parse(allowlist), parse(denylist)
+
+
+@lru_cache(maxsize=4096)
+def classify_ip(ip_address):
+    """Проверка адреса по таблицам сетей.
+
+    Возвращает 'allow', 'deny' или None, если адрес не входит ни в одну таблицу.
+    """
+    allowlist, denylist = _networks(
+        tuple(settings.ANALYTICS_IP_ALLOWLIST),
+        tuple(settings.ANALYTICS_IP_DENYLIST)
+    )
+    try:
+        address = ipaddress.ip_address(ip_address)
+    except ValueError:
+        return None
+
+    if any(address in network for network in allowlist):
+        return 'allow'
+    if any(address in network for network in denylist):
+        return 'deny'
+    return None
+
+
+def _session_rate_exceeded(session):
+    """Превышение допустимого числа событий сессии за текущую минуту."""
+    minute = int(time.time() // 60)
+    key = SESSION_RATE_KEY.format(minute=minute, session=session)
+
+    try:
+        connection = get_redis_connection('default')
+        pipe = connection.pipeline(transaction=False)
+        pipe.incr(key)
+        pipe.expire(key, 120)
+        count = pipe.execute()[0]
+    except Exception as e:
+        logger.warning(f"Не удалось проверить частоту событий сессии: {e}")
+        return False
+
+    return count > settings.ANALYTICS_SESSION_RATE_LIMIT
+
+
+def record_filtered(reason):
+    """Учет отброшенного события в суточном счетчике."""
+    key = FILTERED_KEY.format(date=timezone.localdate().isoformat(), reason=reason)
+    try:
+        connection = get_redis_connection('default')
+        pipe = connection.pipeline(transaction=False)
+        pipe.incr(key)
+        pipe.expire(key, FILTERED_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Не удалось учесть отброшенное событие: {e}")
+
+
+def filter_event(request, session_id=''):
+    """Проверка события аналитики перед записью.
+
+    Возвращает причину отбрасывания или None, если событие нужно сохранить.
+    Отброшенное событие учитывается в счетчике. Адреса из белого списка
+    не проверяются по User-Agent и частоте.
+    """
+    ip_address = get_client_ip(request)
+    ip_rule = classify_ip(ip_address)
+
+    reason = None
+    if ip_rule == 'deny':
+        reason = FILTER_IP
+    elif ip_rule != 'allow':
+        if parse_user_agent(request.META.get('HTTP_USER_AGENT', '')).is_bot:
+            reason = FILTER_BOT
+        elif _session_rate_exceeded(session_id or ip_address):
+            reason = FILTER_RATE
+
+    if reason is not None:
+        record_filtered(reason)
+    return reason
+
+
+def get_filtered_totals(days=30):
+    """Количество отброшенных событий за последние дни по причинам."""
+    today = timezone.localdate()
+    dates = [today - datetime.timedelta(days=offset) for offset in range(days)]
+    keys = [
+        FILTERED_KEY.format(date=date.isoformat(), reason=reason)
+        for date in dates
+        for reason in FILTER_REASONS
+    ]
+
+    connection = get_redis_connection('default')
+    values = connection.mget(keys)
+
+    totals = dict.fromkeys(FILTER_REASONS, 0)
+    today_totals = dict.fromkeys(FILTER_REASONS, 0)
+    for index, value in enumerate(values):
+        reason = FILTER_REASONS[index % len(FILTER_REASONS)]
+        count = int(value or 0)
+        totals[reason] += count
+        if index < len(FILTER_REASONS):
+            today_totals[reason] += count
+
+    return {
+        'today': today_totals,
+        'period': totals,
+        'total': sum(totals.values())
+    }
@@ -0,0 +1,35 @@
+import datetime
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.analytics.archive import ARCHIVE_SOURCES, rehydrate_range
+
+
+class Command(BaseCommand):
+    """Команда Django для загрузки архива аналитики во временную таблицу."""
+
+    help = 'Загрузить архив сырых данных аналитики за период во временную таблицу'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', choices=[str(source) for source in ARCHIVE_SOURCES])
+        parser.add_argument('start_date', type=datetime.date.fromisoformat)
+        parser.add_argument('end_date', type=datetime.date.fromisoformat)
+        parser.add_argument('--table', dest='table_name', default=None)
+
+    def handle(self, *args, **options):
+        """Выполнение команды."""
+        if options['start_date'] > options['end_date']:
+            raise CommandError('Дата начала не может быть позже даты окончания')
+
+        try:
+            result = rehydrate_range(
+                options['source'],
+                options['start_date'],
+                options['end_date'],
+                options['table_name']
+            )
+        except (ValueError, IOError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Загружено строк: {result['rows']} из архивов: {result['archives']} в таблицу {result['table']}"
+        ))
@@ -0,0 +1,138 @@
+import logging
+import time
+
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.utils import get_client_ip
+from .buffer import enqueue_activity
+from .models import UserActivity
+from .realtime import mark_user_active
+from .sampling import record_latency, sample_event
+
+logger = logging.getLogger('app')
+
+# Действия, успешное выполнение которых записывается как активность:
+# (имя маршрута, метод) -> (тип активности, тип контента)
+CAPTURED_ACTIONS = {
+    ('file-download', 'GET'): (UserActivity.ActivityType.FILE_DOWNLOAD, 'file'),
+    ('file-download-version', 'GET'): (UserActivity.ActivityType.FILE_DOWNLOAD, 'file'),
+    ('test-start-attempt', 'POST'): (UserActivity.ActivityType.TEST_START, 'test'),
+    ('test-complete-attempt', 'POST'): (UserActivity.ActivityType.TEST_COMPLETE, 'test'),
+    ('token_obtain_pair', 'POST'): (UserActivity.ActivityType.LOGIN, ''),
+    ('newsarticle-detail', 'GET'): (UserActivity.ActivityType.NEWS_VIEW, 'news_article'),
+}
+
+
+class RequestLatencyMiddleware:
+    """Замер времени обработки запросов для адаптивной выборки аналитики."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.monotonic()
+        response = self.get_response(request)
+        record_latency((time.monotonic() - started) * 1000)
+        return response
+
+
+class ActiveUserMiddleware:
+    """Отметка аутентифицированных пользователей для метрики активности в реальном времени.
+
+    Проверка выполняется после обработки запроса: DRF записывает пользователя,
+    аутентифицированного по JWT, в исходный HttpRequest.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            mark_user_active(user)
+
+        return response
+
+
+class ActivityCaptureMiddleware:
+    """Автоматическая запись активностей пользователей по успешным ответам.
+
+    Активность ставится в буфер при закрытии ответа, то есть после его
+    отправки клиенту, поэтому время обработки запроса не увеличивается,
+    а ошибка Redis не меняет уже отправленный ответ.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        match = request.resolver_match
+        if match is None or not 200 <= response.status_code < 300:
+            return response
+
+        captured = CAPTURED_ACTIONS.get((match.url_name, request.method))
+        if captured is None:
+            return response
+
+        # Продолжение скачивания (Range не с начала файла) не считается
+        # отдельным скачиванием, как и в истории скачиваний файлов
+        if getattr(response, 'download_start', 0) != 0:
+            return response
+
+        user_id = self._get_user_id(request, response)
+        if user_id is None:
+            return response
+
+        activity_type, content_type = captured
+        record = {
+            'user_id': user_id,
+            'activity_type': activity_type,
+            'ip_address': get_client_ip(request),
+            'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+            'content_type': content_type,
+            'object_id': match.kwargs.get('pk') or match.kwargs.get('slug') or '',
+        }
+        self._enqueue_on_close(response, record)
+        return response
+
+    def _enqueue_on_close(self, response, record):
+        """Постановка активности в буфер после закрытия ответа сервером."""
+        close = response.close
+
+        def close_and_enqueue():
+            try:
+                close()
+            finally:
+                self._enqueue(record)
+
+        response.close = close_and_enqueue
+
+    @staticmethod
+    def _get_user_id(request, response):
+        """Пользователь запроса; при входе - владелец выданного токена."""
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user.pk
+
+        access = getattr(response, 'data', None) or {}
+        if not isinstance(access, dict) or 'access' not in access:
+            return None
+        try:
+            return AccessToken(access['access'])['user_id']
+        except (TokenError, KeyError):
+            return None
+
+    @staticmethod
+    def _enqueue(record):
+        """Постановка активности в буфер с учетом режима выборки."""
+        try:
+            sample_weight = sample_event()
+            if sample_weight is not None:
+                enqueue_activity(sample_weight=sample_weight, **record)
+        except Exception as e:
+            logger.warning(f"Не удалось записать активность: {e}")
@@ -1,11 +1,54 @@
+import hashlib
 import uuid
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 User = get_user_model()
 
 
+class UserAgent(models.Model):
+    """Модель справочника строк User-Agent."""
+
+    id = models.AutoField(primary_key=True)
+    user_agent = models.TextField(_('User Agent'))
+    user_agent_hash = models.CharField(_('Хэш User Agent'), max_length=64, unique=True)
+    browser = models.CharField(_('Браузер'), max_length=100, blank=True)
+    os = models.CharField(_('Операционная система'), max_length=100, blank=True)
+    device = models.CharField(_('Устройство'), max_length=100, blank=True)
+    created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('User Agent')
+        verbose_name_plural = _('User Agents')
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.browser} / {self.os} / {self.device}"
+
+    @staticmethod
+    def make_hash(user_agent):
+        """Вычисление хэша строки User-Agent для уникального индекса."""
+        return hashlib.sha256(user_agent.encode('utf-8')).hexdigest()
+
+
+class PageUrl(models.Model):
+    """Модель справочника URL для просмотров страниц."""
+
+    id = models.AutoField(primary_key=True)
+    url = models.CharField(_('URL'), max_length=255, unique=True)
+    created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('URL страницы')
+        verbose_name_plural = _('URL страниц')
+        ordering = ['id']
+
+    def __str__(self):
+        return self.url
+
+
 class PageView(models.Model):
     """Модель просмотра страницы."""
 
@@ -18,21 +61,51 @@ class PageView(models.Model):
         null=True,
         blank=True
     )
-    url = models.CharField(_('URL'), max_length=255)
-    path = models.CharField(_('Путь'), max_length=255)
-    referer = models.CharField(_('Referrer'), max_length=255, blank=True)
+    url = models.ForeignKey(
+        PageUrl,
+        verbose_name=_('URL'),
+        related_name='+',
+        on_delete=models.PROTECT
+    )
+    path = models.ForeignKey(
+        PageUrl,
+        verbose_name=_('Путь'),
+        related_name='+',
+        on_delete=models.PROTECT
+    )
+    referer = models.ForeignKey(
+        PageUrl,
+        verbose_name=_('Referrer'),
+        related_name='+',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True
+    )
     ip_address = models.GenericIPAddressField(_('IP адрес'), null=True, blank=True)
-    user_agent = models.TextField(_('User Agent'), blank=True)
+    user_agent = models.ForeignKey(
+        UserAgent,
+        verbose_name=_('User Agent'),
+        related_name='page_views',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True
+    )
     browser = models.CharField(_('Браузер'), max_length=100, blank=True)
     os = models.CharField(_('Операционная система'), max_length=100, blank=True)
     device = models.CharField(_('Устройство'), max_length=100, blank=True)
     session_id = models.CharField(_('ID сессии'), max_length=100, blank=True)
+    # Количество просмотров, которое представляет запись в режиме выборки
+    sample_weight = models.PositiveIntegerField(_('Вес выборки'), default=1)
     viewed_at = models.DateTimeField(_('Время просмотра'), auto_now_add=True)
 
     class Meta:
         verbose_name = _('Просмотр страницы')
         verbose_name_plural = _('Просмотры страниц')
         ordering = ['-viewed_at']
+        indexes = [
+            models.Index(fields=['viewed_at']),
+            models.Index(fields=['session_id', 'viewed_at']),
+        ]
 
     def __str__(self):
         return f"{self.url} - {self.viewed_at}"
@@ -52,18 +125,29 @@ class UserSession(models.Model):
     )
     session_id = models.CharField(_('ID сессии'), max_length=100)
     ip_address = models.GenericIPAddressField(_('IP адрес'), null=True, blank=True)
-    user_agent = models.TextField(_('User Agent'), blank=True)
+    user_agent = models.ForeignKey(
+        UserAgent,
+        verbose_name=_('User Agent'),
+        related_name='sessions',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True
+    )
     browser = models.CharField(_('Браузер'), max_length=100, blank=True)
     os = models.CharField(_('Операционная система'), max_length=100, blank=True)
     device = models.CharField(_('Устройство'), max_length=100, blank=True)
-    start_time = models.DateTimeField(_('Время начала'), auto_now_add=True)
+    start_time = models.DateTimeField(_('Время начала'), default=timezone.now)
     end_time = models.DateTimeField(_('Время окончания'), null=True, blank=True)
     duration = models.PositiveIntegerField(_('Длительность (сек)'), default=0)
+    page_count = models.PositiveIntegerField(_('Количество просмотров'), default=0)
 
     class Meta:
         verbose_name = _('Сессия пользователя')
         verbose_name_plural = _('Сессии пользователей')
         ordering = ['-start_time']
+        indexes = [
+            models.Index(fields=['session_id', 'end_time']),
+        ]
 
     def __str__(self):
         return f"Сессия {self.session_id} - {self.start_time}"
@@ -85,6 +169,7 @@ class UserActivity(models.Model):
         FILE_DOWNLOAD = 'file_download', _('Скачивание файла')
         TEST_START = 'test_start', _('Начало теста')
         TEST_COMPLETE = 'test_complete', _('Завершение теста')
+        NEWS_VIEW = 'news_view', _('Просмотр новости')
         OTHER = 'other', _('Другое')
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -101,8 +186,18 @@ class UserActivity(models.Model):
     )
     description = models.TextField(_('Описание'), blank=True)
     ip_address = models.GenericIPAddressField(_('IP адрес'), null=True, blank=True)
-    user_agent = models.TextField(_('User Agent'), blank=True)
-    created_at = models.DateTimeField(_('Время создания'), auto_now_add=True)
+    user_agent = models.ForeignKey(
+        UserAgent,
+        verbose_name=_('User Agent'),
+        related_name='activities',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True
+    )
+    # Количество активностей, которое представляет запись в режиме выборки
+    sample_weight = models.PositiveIntegerField(_('Вес выборки'), default=1)
+    # Время задается явно при пакетной записи из буфера
+    created_at = models.DateTimeField(_('Время создания'), default=timezone.now)
 
     # Ссылка на связанный объект (полиморфная связь)
     content_type = models.CharField(_('Тип контента'), max_length=100, blank=True)
@@ -112,11 +207,39 @@ class UserActivity(models.Model):
         verbose_name = _('Активность пользователя')
         verbose_name_plural = _('Активности пользователей')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
 
     def __str__(self):
         return f"{self.user} - {self.get_activity_type_display()} - {self.created_at}"
 
 
+class ActivityCube(models.Model):
+    """Модель почасового куба активности пользователей."""
+
+    hour = models.DateTimeField(_('Час'))
+    activity_type = models.CharField(
+        _('Тип активности'),
+        max_length=20,
+        choices=UserActivity.ActivityType.choices
+    )
+    department_id = models.PositiveIntegerField(_('ID отделения'), null=True, blank=True)
+    specialization_id = models.PositiveIntegerField(_('ID специализации'), null=True, blank=True)
+    count = models.PositiveIntegerField(_('Количество'), default=0)
+
+    class Meta:
+        verbose_name = _('Куб активности')
+        verbose_name_plural = _('Куб активности')
+        ordering = ['-hour', 'activity_type']
+        indexes = [
+            models.Index(fields=['hour', 'activity_type']),
+        ]
+
+    def __str__(self):
+        return f"{self.hour} - {self.activity_type} - {self.count}"
+
+
 class DailyStatistics(models.Model):
     """Модель ежедневной статистики."""
 
@@ -186,4 +309,33 @@ class PopularPage(models.Model):
         unique_together = ['url', 'date']
 
     def __str__(self):
-        return f"{self.url} - {self.views_count} просмотров ({self.date})"
\ No newline at end of file
+        return f"{self.url} - {self.views_count} просмотров ({self.date})"
+
+
+class AnalyticsArchive(models.Model):
+    """Модель записи архива сырых данных аналитики за сутки."""
+
+    class Source(models.TextChoices):
+        PAGE_VIEW = 'page_view', _('Просмотры страниц')
+        NEWS_VIEW = 'news_view', _('Просмотры новостей')
+        FILE_DOWNLOAD = 'file_download', _('Скачивания файлов')
+
+    source = models.CharField(_('Источник'), max_length=20, choices=Source.choices)
+    date = models.DateField(_('Дата'))
+    part = models.PositiveIntegerField(_('Часть'), default=0)
+    file_path = models.CharField(_('Путь к файлу'), max_length=255)
+    row_count = models.PositiveIntegerField(_('Количество строк'), default=0)
+    file_size = models.PositiveBigIntegerField(_('Размер файла'), default=0)
+    checksum = models.CharField(_('Контрольная сумма SHA-256'), max_length=64)
+    created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('Архив аналитики')
+        verbose_name_plural = _('Архивы аналитики')
+        ordering = ['-date', 'source', 'part']
+        unique_together = ['source', 'date', 'part']
+
+    def __str__(self):
+        if self.part:
+            return f"{self.get_source_display()} - {self.date} (часть {self.part})"
+        return f"{self.get_source_display()} - {self.date}"
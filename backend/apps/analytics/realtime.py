@@ -0,0 +1,160 @@
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+from django_redis import get_redis_connection
+
+logger = logging.getLogger('app')
+
+# Ключ хэша активных пользователей за минуту: user_id -> department_id
+ACTIVE_USERS_KEY = 'analytics:active_users:{minute}'
+
+# Время хранения поминутных данных (сек)
+ACTIVE_USERS_TTL = 2 * 60 * 60
+
+# Окно, в котором пользователь считается активным "сейчас" (мин)
+ACTIVE_WINDOW_MINUTES = 5
+
+# Длина поминутного графика активности (мин)
+SPARKLINE_MINUTES = 60
+
+# Ключ отсортированного множества просмотров URL за час
+TOP_PAGES_KEY = 'analytics:top_pages:{hour}'
+
+# Ключ для объединения часовых множеств при запросе
+TOP_PAGES_UNION_KEY = 'analytics:top_pages:union'
+
+# Время хранения часовых множеств (сек)
+TOP_PAGES_TTL = 25 * 60 * 60
+
+# Максимальное окно запроса популярных страниц (ч)
+TOP_PAGES_MAX_HOURS = 24
+
+# Количество URL, сохраняемых в часовом множестве после усечения.
+# Усечение выполняется при двукратном превышении, поэтому память
+# ограничена независимо от числа различных URL.
+TOP_PAGES_CAPACITY = 1000
+
+# Минута последней отметки пользователя в текущем процессе,
+# чтобы не обращаться к Redis на каждый запрос одного пользователя.
+_last_marked = {}
+
+
+def _current_minute(now=None):
+    """Номер минуты с начала эпохи."""
+    return int((now if now is not None else time.time()) // 60)
+
+
+def _minute_key(minute):
+    """Ключ Redis для указанной минуты."""
+    return ACTIVE_USERS_KEY.format(minute=minute)
+
+
+def mark_user_active(user, now=None):
+    """Отметка пользователя как активного в текущую минуту."""
+    minute = _current_minute(now)
+    if _last_marked.get(user.pk) == minute:
+        return
+
+    key = _minute_key(minute)
+    try:
+        connection = get_redis_connection('default')
+        pipe = connection.pipeline(transaction=False)
+        pipe.hset(key, str(user.pk), user.department_id or '')
+        pipe.expire(key, ACTIVE_USERS_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Не удалось отметить активность пользователя: {e}")
+        return
+
+    # Словарь очищается при смене минуты, чтобы не расти бесконечно
+    if _last_marked and next(iter(_last_marked.values())) != minute:
+        _last_marked.clear()
+    _last_marked[user.pk] = minute
+
+
+def get_realtime_activity(now=None):
+    """Получение активных пользователей и поминутного графика из Redis.
+
+    Выполняет O(SPARKLINE_MINUTES) команд за один проход конвейера.
+    """
+    current = _current_minute(now)
+    minutes = list(range(current - SPARKLINE_MINUTES + 1, current + 1))
+    window = minutes[-ACTIVE_WINDOW_MINUTES:]
+
+    connection = get_redis_connection('default')
+    pipe = connection.pipeline(transaction=False)
+    for minute in minutes:
+        pipe.hlen(_minute_key(minute))
+    for minute in window:
+        pipe.hgetall(_minute_key(minute))
+    results = pipe.execute()
+
+    counts = results[:len(minutes)]
+    active = {}
+    for members in results[len(minutes):]:
+        for user_id, department_id in members.items():
+            active[user_id.decode()] = department_id.decode() or None
+
+    by_department = Counter(active.values())
+
+    return {
+        'active_users': len(active),
+        'window_minutes': ACTIVE_WINDOW_MINUTES,
+        'by_department': [
+            {
+                'department_id': int(department_id) if department_id else None,
+                'count': count
+            }
+            for department_id, count in by_department.most_common()
+        ],
+        'sparkline': [
+            {
+                'minute': datetime.fromtimestamp(minute * 60, tz=dt_timezone.utc).isoformat(),
+                'count': count
+            }
+            for minute, count in zip(minutes, counts)
+        ]
+    }
+
+
+def record_page_view(url, weight=1, now=None):
+    """Учет просмотра URL в часовом множестве популярных страниц."""
+    hour = int((now if now is not None else time.time()) // 3600)
+    key = TOP_PAGES_KEY.format(hour=hour)
+
+    try:
+        connection = get_redis_connection('default')
+        pipe = connection.pipeline(transaction=False)
+        pipe.zincrby(key, weight, url)
+        pipe.expire(key, TOP_PAGES_TTL)
+        pipe.zcard(key)
+        size = pipe.execute()[-1]
+
+        # Вытесняем наименее популярные URL часа
+        if size > TOP_PAGES_CAPACITY * 2:
+            connection.zremrangebyrank(key, 0, size - TOP_PAGES_CAPACITY - 1)
+    except Exception as e:
+        logger.warning(f"Не удалось учесть просмотр страницы: {e}")
+
+
+def get_top_pages(limit=10, hours=TOP_PAGES_MAX_HOURS, now=None):
+    """Получение самых просматриваемых URL за последние часы из Redis."""
+    current = int((now if now is not None else time.time()) // 3600)
+    hours = max(1, min(hours, TOP_PAGES_MAX_HOURS))
+    # ZREVRANGE с концом -1 вернул бы все объединенное множество
+    limit = max(1, min(limit, TOP_PAGES_CAPACITY))
+    keys = [TOP_PAGES_KEY.format(hour=hour) for hour in range(current - hours + 1, current + 1)]
+
+    connection = get_redis_connection('default')
+    pipe = connection.pipeline(transaction=True)
+    pipe.zunionstore(TOP_PAGES_UNION_KEY, keys)
+    pipe.zrevrange(TOP_PAGES_UNION_KEY, 0, limit - 1, withscores=True)
+    pipe.delete(TOP_PAGES_UNION_KEY)
+    pages = pipe.execute()[1]
+
+    return [
+        {'url': url.decode(), 'total_views': int(score)}
+        for url, score in pages
+    ]
@@ -0,0 +1,103 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+logger = logging.getLogger('app')
+
+# Количество последних запросов процесса для оценки p95 времени ответа
+LATENCY_WINDOW_SIZE = 1000
+
+# Минимальное количество замеров, при котором p95 считается надежным
+LATENCY_MIN_SAMPLES = 50
+
+# Период пересчета режима выборки (сек)
+SAMPLING_CHECK_INTERVAL = 5
+
+_latencies = deque(maxlen=LATENCY_WINDOW_SIZE)
+_state = {'checked_at': 0.0, 'rate': 1}
+_lock = threading.Lock()
+
+
+def record_latency(duration_ms):
+    """Сохранение времени обработки запроса в скользящем окне процесса."""
+    _latencies.append(duration_ms)
+
+
+def get_latency_p95():
+    """95-й перцентиль времени ответа по скользящему окну (мс)."""
+    values = sorted(_latencies)
+    if len(values) < LATENCY_MIN_SAMPLES:
+        return None
+    return values[int(len(values) * 0.95) - 1]
+
+
+def get_buffer_depth():
+    """Суммарная длина отслеживаемых очередей Redis."""
+    queues = settings.ANALYTICS_SAMPLING_QUEUES
+    if not queues:
+        return 0
+
+    connection = get_redis_connection('default')
+    pipe = connection.pipeline(transaction=False)
+    for queue in queues:
+        pipe.llen(queue)
+    return sum(pipe.execute())
+
+
+def _compute_sample_rate():
+    """Выбор режима: полный учет или 1 из N при перегрузке."""
+    p95 = get_latency_p95()
+    if p95 is not None and p95 > settings.ANALYTICS_SAMPLING_P95_MS:
+        return settings.ANALYTICS_SAMPLING_RATE
+
+    try:
+        depth = get_buffer_depth()
+    except Exception as e:
+        logger.warning(f"Не удалось получить длину очередей для выборки аналитики: {e}")
+        return 1
+
+    if depth > settings.ANALYTICS_SAMPLING_QUEUE_DEPTH:
+        return settings.ANALYTICS_SAMPLING_RATE
+    return 1
+
+
+def get_sample_rate():
+    """Текущий знаменатель выборки N: 1 означает учет всех событий.
+
+    Режим пересчитывается не чаще раза в SAMPLING_CHECK_INTERVAL секунд,
+    поэтому на каждое событие приходится только сравнение времени.
+    """
+    if not settings.ANALYTICS_SAMPLING_ENABLED:
+        return 1
+
+    now = time.monotonic()
+    if now - _state['checked_at'] >= SAMPLING_CHECK_INTERVAL and _lock.acquire(blocking=False):
+        try:
+            previous = _state['rate']
+            _state['rate'] = max(1, _compute_sample_rate())
+            _state['checked_at'] = now
+            if _state['rate'] != previous:
+                logger.info(f"Режим выборки аналитики изменен: 1 из {_state['rate']}")
+        finally:
+            _lock.release()
+
+    return _state['rate']
+
+
+def sample_event():
+    """Решение о записи события.
+
+    Возвращает вес записи (сколько событий она представляет)
+    или None, если событие не попало в выборку.
+    """
+    rate = get_sample_rate()
+    if rate == 1:
+        return 1
+    if random.random() < 1.0 / rate:
+        return rate
+    return None
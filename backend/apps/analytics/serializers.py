@@ -9,6 +9,10 @@ from .models import (
 class PageViewSerializer(serializers.ModelSerializer):
     """Сериализатор для модели PageView."""
 
+    url = serializers.CharField(source='url.url', read_only=True)
+    path = serializers.CharField(source='path.url', read_only=True)
+    referer = serializers.CharField(source='referer.url', read_only=True, default='')
+    user_agent = serializers.CharField(source='user_agent.user_agent', read_only=True, default='')
     user_details = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
@@ -16,9 +20,9 @@ class PageViewSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'user', 'url', 'path', 'referer', 'ip_address',
             'user_agent', 'browser', 'os', 'device', 'session_id',
-            'viewed_at', 'user_details'
+            'sample_weight', 'viewed_at', 'user_details'
         ]
-        read_only_fields = ['viewed_at']
+        read_only_fields = ['sample_weight', 'viewed_at']
 
     def get_user_details(self, obj):
         """Получение информации о пользователе."""
@@ -34,6 +38,7 @@ class PageViewSerializer(serializers.ModelSerializer):
 class UserSessionSerializer(serializers.ModelSerializer):
     """Сериализатор для модели UserSession."""
 
+    user_agent = serializers.CharField(source='user_agent.user_agent', read_only=True, default='')
     user_details = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
@@ -41,9 +46,9 @@ class UserSessionSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'user', 'session_id', 'ip_address', 'user_agent',
             'browser', 'os', 'device', 'start_time', 'end_time',
-            'duration', 'user_details'
+            'duration', 'page_count', 'user_details'
         ]
-        read_only_fields = ['start_time', 'end_time', 'duration']
+        read_only_fields = ['start_time', 'end_time', 'duration', 'page_count']
 
     def get_user_details(self, obj):
         """Получение информации о пользователе."""
@@ -59,6 +64,7 @@ class UserSessionSerializer(serializers.ModelSerializer):
 class UserActivitySerializer(serializers.ModelSerializer):
     """Сериализатор для модели UserActivity."""
 
+    user_agent = serializers.CharField(source='user_agent.user_agent', read_only=True, default='')
     user_details = serializers.SerializerMethodField(read_only=True)
     activity_type_display = serializers.SerializerMethodField(read_only=True)
 
@@ -67,9 +73,9 @@ class UserActivitySerializer(serializers.ModelSerializer):
         fields = [
             'id', 'user', 'activity_type', 'description', 'ip_address',
             'user_agent', 'created_at', 'content_type', 'object_id',
-            'user_details', 'activity_type_display'
+            'sample_weight', 'user_details', 'activity_type_display'
         ]
-        read_only_fields = ['created_at']
+        read_only_fields = ['sample_weight', 'created_at']
 
     def get_user_details(self, obj):
         """Получение информации о пользователе."""
@@ -154,4 +160,12 @@ class ActivityAnalyticsSerializer(serializers.Serializer):
     end_date = serializers.DateField(required=False)
     user_id = serializers.UUIDField(required=False)
     department_id = serializers.IntegerField(required=False)
-    specialization_id = serializers.IntegerField(required=False)
\ No newline at end of file
+    specialization_id = serializers.IntegerField(required=False)
+
+
+class CohortAnalyticsSerializer(serializers.Serializer):
+    """Сериализатор параметров когортного анализа и воронки."""
+
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+    periods = serializers.IntegerField(required=False, min_value=1, max_value=52, default=8)
@@ -0,0 +1,142 @@
+import datetime
+
+from django.db import transaction
+from django.db.models import F, Max, Window
+from django.db.models.functions import Lag
+from django.utils import timezone
+
+from core.models import SystemSetting
+from .models import PageView, UserSession
+
+# Перерыв в активности, после которого начинается новая сессия
+SESSION_INACTIVITY_GAP = datetime.timedelta(minutes=30)
+
+# Отставание от текущего времени, чтобы не пропустить просмотры
+# из транзакций, которые еще не зафиксированы
+SESSIONIZATION_LAG = datetime.timedelta(minutes=1)
+
+# Размер порции при потоковом чтении просмотров
+SESSIONIZATION_CHUNK_SIZE = 5000
+
+# Ключ настройки с временем последнего обработанного просмотра
+SESSIONIZATION_WATERMARK_KEY = 'analytics.sessionization_watermark'
+
+
+def get_sessionization_watermark():
+    """Время, до которого просмотры уже разбиты на сессии."""
+    setting = SystemSetting.objects.filter(key=SESSIONIZATION_WATERMARK_KEY).first()
+    if setting is None:
+        return None
+    return datetime.datetime.fromisoformat(setting.value)
+
+
+def set_sessionization_watermark(value):
+    """Сохранение времени последнего обработанного просмотра."""
+    SystemSetting.objects.update_or_create(
+        key=SESSIONIZATION_WATERMARK_KEY,
+        defaults={
+            'value': value.isoformat(),
+            'description': 'Время, до которого просмотры страниц разбиты на сессии'
+        }
+    )
+
+
+def _latest_sessions(session_ids, since):
+    """Последние сессии для указанных идентификаторов, которые еще можно продолжить."""
+    latest = {}
+    session_ids = list(session_ids)
+    for index in range(0, len(session_ids), 1000):
+        sessions = UserSession.objects.filter(
+            session_id__in=session_ids[index:index + 1000],
+            end_time__gte=since
+        ).order_by('session_id', 'end_time')
+        for session in sessions:
+            latest[session.session_id] = session
+    return latest
+
+
+def sessionize_page_views(now=None):
+    """Построение сессий пользователей по новым просмотрам страниц.
+
+    Просмотры упорядочиваются по (session_id, viewed_at), перерывы между
+    соседними просмотрами вычисляются оконной функцией LAG. Перерыв дольше
+    SESSION_INACTIVITY_GAP начинает новую сессию. Первый новый просмотр
+    продолжает последнюю сохраненную сессию, если перерыв после нее короче.
+    Первый запуск начинается после окончания последней существующей сессии.
+    """
+    upper = (now or timezone.now()) - SESSIONIZATION_LAG
+    watermark = get_sessionization_watermark()
+    if watermark is None:
+        # При первом запуске просмотры, уже покрытые сессиями
+        # прежнего учета, не разбиваются на сессии повторно
+        watermark = UserSession.objects.aggregate(last_end=Max('end_time'))['last_end']
+
+    views = PageView.objects.exclude(session_id='').filter(viewed_at__lte=upper)
+    if watermark is not None:
+        views = views.filter(viewed_at__gt=watermark)
+
+    session_ids = set(views.values_list('session_id', flat=True).distinct())
+    if not session_ids:
+        set_sessionization_watermark(upper)
+        return {'created': 0, 'updated': 0}
+
+    since = (watermark or upper) - SESSION_INACTIVITY_GAP
+    existing = _latest_sessions(session_ids, since) if watermark is not None else {}
+
+    rows = views.annotate(
+        previous_viewed_at=Window(
+            expression=Lag('viewed_at'),
+            partition_by=[F('session_id')],
+            order_by=F('viewed_at').asc()
+        )
+    ).order_by('session_id', 'viewed_at').values_list(
+        'session_id', 'viewed_at', 'previous_viewed_at', 'user_id',
+        'ip_address', 'user_agent_id', 'browser', 'os', 'device', 'sample_weight'
+    )
+
+    created, updated = [], []
+    current = None
+
+    for (session_id, viewed_at, previous_viewed_at, user_id,
+         ip_address, user_agent_id, browser, os, device, sample_weight) in rows.iterator(chunk_size=SESSIONIZATION_CHUNK_SIZE):
+
+        if previous_viewed_at is None:
+            # Первый новый просмотр сессии: продолжаем сохраненную сессию или начинаем новую
+            current = None
+            session = existing.get(session_id)
+            if session is not None and viewed_at - session.end_time <= SESSION_INACTIVITY_GAP:
+                current = session
+                updated.append(session)
+        elif viewed_at - previous_viewed_at > SESSION_INACTIVITY_GAP:
+            current = None
+
+        if current is None:
+            current = UserSession(
+                session_id=session_id,
+                user_id=user_id,
+                ip_address=ip_address,
+                user_agent_id=user_agent_id,
+                browser=browser,
+                os=os,
+                device=device,
+                start_time=viewed_at,
+                end_time=viewed_at,
+                page_count=0
+            )
+            created.append(current)
+
+        if current.user_id is None and user_id is not None:
+            current.user_id = user_id
+
+        current.end_time = viewed_at
+        current.duration = int((current.end_time - current.start_time).total_seconds())
+        current.page_count += sample_weight
+
+    with transaction.atomic():
+        UserSession.objects.bulk_create(created, batch_size=1000)
+        UserSession.objects.bulk_update(
+            updated, ['user', 'end_time', 'duration', 'page_count'], batch_size=1000
+        )
+        set_sessionization_watermark(upper)
+
+    return {'created': len(created), 'updated': len(updated)}
@@ -0,0 +1,147 @@
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, F, Sum
+
+from .cohorts import report_cache_key
+from .models import UserStatistics
+
+# Время хранения сводной статистики пользователей в кэше (сек)
+SUMMARY_CACHE_TIMEOUT = 5 * 60
+
+# Поля, по которым вычисляются средние значения: ключ ответа -> поле модели
+SUMMARY_AVERAGES = {
+    'avg_login_count': 'login_count',
+    'avg_session_duration': 'average_session_duration',
+    'avg_page_views': 'total_page_views',
+    'avg_files_uploaded': 'files_uploaded',
+    'avg_files_downloaded': 'files_downloaded',
+    'avg_tests_started': 'tests_started',
+    'avg_tests_completed': 'tests_completed',
+    'avg_tests_passed': 'tests_passed',
+}
+
+# Разрезы: ключ ответа -> (колонка выборки, ключ значения в элементах разреза)
+SUMMARY_BREAKDOWNS = {
+    'users_by_role': ('role', 'user__role'),
+    'users_by_department': ('department', 'user__department__name'),
+    'users_by_specialization': ('specialization', 'user__specialization__name'),
+}
+
+
+def _base_rows(department_id=None, specialization_id=None, role=None):
+    """Строки статистики пользователей с колонками разрезов после фильтрации."""
+    queryset = UserStatistics.objects.all()
+
+    if department_id:
+        queryset = queryset.filter(user__department__id=department_id)
+
+    if specialization_id:
+        queryset = queryset.filter(user__specialization__id=specialization_id)
+
+    if role:
+        queryset = queryset.filter(user__role=role)
+
+    return queryset.values(
+        'id', *SUMMARY_AVERAGES.values(),
+        role=F('user__role'),
+        department=F('user__department__name'),
+        specialization=F('user__specialization__name')
+    ).order_by()
+
+
+def _grouping_sets_rows(base):
+    """Все разрезы одним запросом с GROUPING SETS (PostgreSQL).
+
+    Возвращает кортежи (разрез или None для итога, значение, количество, суммы).
+    """
+    quote = connection.ops.quote_name
+    sql, params = base.query.sql_with_params()
+    columns = [column for column, _ in SUMMARY_BREAKDOWNS.values()]
+
+    grouping = ', '.join(f"GROUPING({quote(column)})" for column in columns)
+    sums = ', '.join(f"SUM({quote(field)})" for field in SUMMARY_AVERAGES.values())
+    sets = ', '.join(['()'] + [f"({quote(column)})" for column in columns])
+
+    query = (
+        f"SELECT {grouping}, {', '.join(quote(column) for column in columns)}, COUNT(*), {sums} "
+        f"FROM ({sql}) AS user_statistics GROUP BY GROUPING SETS ({sets})"
+    )
+
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        for row in cursor.fetchall():
+            flags = row[:len(columns)]
+            values = row[len(columns):2 * len(columns)]
+            count, totals = row[2 * len(columns)], row[2 * len(columns) + 1:]
+
+            # В строке разреза сгруппирована только одна колонка (флаг 0)
+            grouped = [index for index, flag in enumerate(flags) if flag == 0]
+            if grouped:
+                yield columns[grouped[0]], values[grouped[0]], count, totals
+            else:
+                yield None, None, count, totals
+
+
+def _fallback_rows(base):
+    """Все разрезы одним запросом без GROUPING SETS.
+
+    Строки группируются по сочетанию всех колонок разрезов,
+    итоги и отдельные разрезы сворачиваются в Python.
+    """
+    columns = [column for column, _ in SUMMARY_BREAKDOWNS.values()]
+    fields = list(SUMMARY_AVERAGES.values())
+    rows = base.values(*columns).annotate(
+        count=Count('id'),
+        **{f"sum_{field}": Sum(field) for field in fields}
+    ).order_by()
+
+    groups = {}
+    for row in rows:
+        totals = [row[f"sum_{field}"] or 0 for field in fields]
+        for key in [(None, None)] + [(column, row[column]) for column in columns]:
+            count, sums = groups.get(key, (0, [0] * len(fields)))
+            groups[key] = (count + row['count'], [a + b for a, b in zip(sums, totals)])
+
+    for (column, value), (count, sums) in groups.items():
+        yield column, value, count, sums
+
+
+def compute_user_statistics_summary(department_id=None, specialization_id=None, role=None):
+    """Сводная статистика пользователей со всеми разрезами за один проход."""
+    base = _base_rows(department_id, specialization_id, role)
+    rows = _grouping_sets_rows(base) if connection.vendor == 'postgresql' else _fallback_rows(base)
+
+    summary = dict.fromkeys(SUMMARY_AVERAGES)
+    summary['total_users'] = 0
+    breakdowns = {key: [] for key in SUMMARY_BREAKDOWNS}
+    keys_by_column = {column: (key, value_key) for key, (column, value_key) in SUMMARY_BREAKDOWNS.items()}
+
+    for column, value, count, totals in rows:
+        if column is None:
+            summary['total_users'] = count
+            if count:
+                for key, total in zip(SUMMARY_AVERAGES, totals):
+                    summary[key] = float(total) / count
+        else:
+            key, value_key = keys_by_column[column]
+            breakdowns[key].append({value_key: value, 'count': count})
+
+    summary.update(breakdowns)
+    return summary
+
+
+def get_user_statistics_summary(department_id=None, specialization_id=None, role=None):
+    """Сводная статистика пользователей с кэшированием по параметрам фильтрации."""
+    params = {
+        'department': department_id or None,
+        'specialization': specialization_id or None,
+        'role': role or None,
+    }
+    cache_key = report_cache_key('user_statistics_summary', params)
+
+    summary = cache.get(cache_key)
+    if summary is None:
+        summary = compute_user_statistics_summary(department_id, specialization_id, role)
+        cache.set(cache_key, summary, SUMMARY_CACHE_TIMEOUT)
+
+    return summary
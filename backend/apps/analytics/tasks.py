@@ -0,0 +1,314 @@
+import datetime
+import logging
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Avg, Count, Sum
+from django.utils import timezone
+from celery import shared_task
+
+from core.models import SystemLog
+from .models import PageView, UserSession, UserActivity, DailyStatistics, PopularPage
+from .aggregates import rollup_activity_cube, daily_activity_counts, day_bounds
+from .cohorts import build_cohorts, build_funnel, report_cache_key, COHORT_CACHE_TIMEOUT
+from .sessionization import sessionize_page_views
+from .archive import archive_expired_analytics, rehydrate_range
+from .buffer import flush_activity_buffer
+from .dashboard import DASHBOARD_LOCK_KEY, invalidate_dashboard, refresh_dashboard
+
+logger = logging.getLogger('app')
+
+# Ключ блокировки, исключающей параллельный запуск разбиения на сессии
+SESSIONIZATION_LOCK_KEY = 'analytics:sessionization:lock'
+SESSIONIZATION_LOCK_TIMEOUT = 30 * 60
+
+User = get_user_model()
+
+# Количество страниц, сохраняемых в популярных за день
+POPULAR_PAGES_LIMIT = 100
+
+
+def rollup_daily_statistics(date):
+    """Пересчет ежедневной статистики за указанную дату."""
+    day_start, day_end = day_bounds(date)
+
+    page_views = PageView.objects.filter(viewed_at__gte=day_start, viewed_at__lt=day_end)
+    sessions = UserSession.objects.filter(start_time__gte=day_start, start_time__lt=day_end)
+    activity_counts = {
+        item['activity_type']: item['count']
+        for item in daily_activity_counts(start_date=date, end_date=date)
+    }
+
+    session_summary = sessions.aggregate(
+        total_sessions=Count('id'),
+        average_session_duration=Avg('duration')
+    )
+
+    statistics, _ = DailyStatistics.objects.update_or_create(
+        date=date,
+        defaults={
+            'total_views': page_views.aggregate(total=Sum('sample_weight'))['total'] or 0,
+            'unique_visitors': page_views.values('ip_address').distinct().count(),
+            'registered_users': User.objects.filter(date_joined__lt=day_end).count(),
+            'new_users': User.objects.filter(date_joined__gte=day_start, date_joined__lt=day_end).count(),
+            'active_users': UserActivity.objects.filter(
+                created_at__gte=day_start,
+                created_at__lt=day_end
+            ).values('user').distinct().count(),
+            'average_session_duration': int(session_summary['average_session_duration'] or 0),
+            'total_sessions': session_summary['total_sessions'],
+            'files_uploaded': activity_counts.get(UserActivity.ActivityType.FILE_UPLOAD, 0),
+            'files_downloaded': activity_counts.get(UserActivity.ActivityType.FILE_DOWNLOAD, 0),
+            'tests_started': activity_counts.get(UserActivity.ActivityType.TEST_START, 0),
+            'tests_completed': activity_counts.get(UserActivity.ActivityType.TEST_COMPLETE, 0),
+        }
+    )
+    return statistics
+
+
+def rollup_popular_pages(date):
+    """Пересчет популярных страниц за указанную дату."""
+    day_start, day_end = day_bounds(date)
+
+    pages = PageView.objects.filter(
+        viewed_at__gte=day_start,
+        viewed_at__lt=day_end
+    ).values('url__url').annotate(
+        views=Sum('sample_weight'),
+        visitors=Count('ip_address', distinct=True)
+    ).order_by('-views')[:POPULAR_PAGES_LIMIT]
+
+    for page in pages:
+        PopularPage.objects.update_or_create(
+            url=page['url__url'],
+            date=date,
+            defaults={
+                'views_count': page['views'],
+                'unique_visitors': page['visitors']
+            }
+        )
+
+    return len(pages)
+
+
+@shared_task
+def update_analytics():
+    """Плановый пересчет агрегированной аналитики."""
+    try:
+        # Записываем накопленные активности, чтобы они попали в куб
+        try:
+            flush_activity_buffer()
+        except Exception as e:
+            logger.warning(f"Буфер активностей не записан перед пересчетом: {e}")
+
+        # Достраиваем куб активности по завершенным часам
+        cube_rows = rollup_activity_cube()
+
+        # Пересчитываем статистику за вчера и сегодня
+        today = timezone.localdate()
+        for date in [today - datetime.timedelta(days=1), today]:
+            rollup_daily_statistics(date)
+            rollup_popular_pages(date)
+
+        # Закэшированные дашборды пересчитываются при следующем обращении
+        invalidate_dashboard()
+
+        return {
+            'status': 'success',
+            'cube_rows': cube_rows
+        }
+
+    except Exception as e:
+        # Логируем ошибку
+        error_message = str(e)
+        SystemLog.objects.create(
+            level=SystemLog.LogLevel.ERROR,
+            module='analytics',
+            message=f"Ошибка при обновлении аналитики: {error_message}"
+        )
+
+        return {
+            'status': 'error',
+            'error': error_message
+        }
+
+
+@shared_task
+def update_sessions():
+    """Плановое разбиение новых просмотров страниц на сессии."""
+    if not cache.add(SESSIONIZATION_LOCK_KEY, True, SESSIONIZATION_LOCK_TIMEOUT):
+        return {
+            'status': 'skipped',
+            'reason': 'already running'
+        }
+
+    try:
+        result = sessionize_page_views()
+        result['status'] = 'success'
+        return result
+
+    except Exception as e:
+        # Логируем ошибку
+        error_message = str(e)
+        SystemLog.objects.create(
+            level=SystemLog.LogLevel.ERROR,
+            module='analytics',
+            message=f"Ошибка при разбиении просмотров на сессии: {error_message}"
+        )
+
+        return {
+            'status': 'error',
+            'error': error_message
+        }
+
+    finally:
+        cache.delete(SESSIONIZATION_LOCK_KEY)
+
+
+@shared_task
+def compute_cohort_report(kind, params):
+    """Расчет когортного отчета или воронки и сохранение результата в кэш."""
+    cache_key = report_cache_key(kind, params)
+
+    try:
+        start_date = datetime.date.fromisoformat(params['start_date'])
+        end_date = datetime.date.fromisoformat(params['end_date'])
+
+        if kind == 'cohorts':
+            report = build_cohorts(start_date, end_date, params['periods'])
+        else:
+            report = build_funnel(start_date, end_date)
+
+        report['params'] = params
+        report['computed_at'] = timezone.now().isoformat()
+        cache.set(cache_key, report, COHORT_CACHE_TIMEOUT)
+
+        return {
+            'status': 'success',
+            'cache_key': cache_key
+        }
+
+    except Exception as e:
+        # Логируем ошибку
+        error_message = str(e)
+        SystemLog.objects.create(
+            level=SystemLog.LogLevel.ERROR,
+            module='analytics',
+            message=f"Ошибка при расчете отчета {kind}: {error_message}"
+        )
+
+        return {
+            'status': 'error',
+            'error': error_message
+        }
+
+    finally:
+        cache.delete(f"{cache_key}:pending")
+
+
+@shared_task
+def archive_analytics():
+    """Плановая архивация сырых данных аналитики старше срока хранения."""
+    try:
+        archived = archive_expired_analytics()
+
+        return {
+            'status': 'success',
+            'archived': archived
+        }
+
+    except Exception as e:
+        # Логируем ошибку
+        error_message = str(e)
+        SystemLog.objects.create(
+            level=SystemLog.LogLevel.ERROR,
+            module='analytics',
+            message=f"Ошибка при архивации аналитики: {error_message}"
+        )
+
+        return {
+            'status': 'error',
+            'error': error_message
+        }
+
+
+@shared_task
+def rehydrate_analytics(source, start_date, end_date, table_name=None):
+    """Загрузка архива аналитики за период во временную таблицу."""
+    try:
+        result = rehydrate_range(
+            source,
+            datetime.date.fromisoformat(start_date),
+            datetime.date.fromisoformat(end_date),
+            table_name
+        )
+        result['status'] = 'success'
+        return result
+
+    except Exception as e:
+        # Логируем ошибку
+        error_message = str(e)
+        SystemLog.objects.create(
+            level=SystemLog.LogLevel.ERROR,
+            module='analytics',
+            message=f"Ошибка при восстановлении архива аналитики: {error_message}"
+        )
+
+        return {
+            'status': 'error',
+            'error': error_message
+        }
+
+
+@shared_task
+def flush_activities():
+    """Плановая запись активностей из буфера в базу."""
+    try:
+        written = flush_activity_buffer()
+
+        return {
+            'status': 'success',
+            'written': written
+        }
+
+    except Exception as e:
+        # Логируем ошибку
+        error_message = str(e)
+        SystemLog.objects.create(
+            level=SystemLog.LogLevel.ERROR,
+            module='analytics',
+            message=f"Ошибка при записи активностей из буфера: {error_message}"
+        )
+
+        return {
+            'status': 'error',
+            'error': error_message
+        }
+
+
+@shared_task
+def refresh_dashboard_cache(days=30):
+    """Фоновый пересчет закэшированного дашборда."""
+    try:
+        refresh_dashboard(days)
+
+        return {
+            'status': 'success',
+            'days': days
+        }
+
+    except Exception as e:
+        # Логируем ошибку
+        error_message = str(e)
+        SystemLog.objects.create(
+            level=SystemLog.LogLevel.ERROR,
+            module='analytics',
+            message=f"Ошибка при пересчете дашборда: {error_message}"
+        )
+
+        return {
+            'status': 'error',
+            'error': error_message
+        }
+
+    finally:
+        cache.delete(DASHBOARD_LOCK_KEY.format(days=days))
@@ -0,0 +1,77 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+# Размер LRU-кэша разобранных строк User-Agent.
+# Трафик идет в основном с ограниченного набора рабочих станций,
+# поэтому нескольких тысяч записей достаточно с большим запасом.
+USER_AGENT_CACHE_SIZE = 4096
+
+ParsedUserAgent = namedtuple('ParsedUserAgent', ['browser', 'os', 'device', 'is_bot'])
+
+# Правила проверяются по порядку, срабатывает первое совпадение.
+# Порядок важен: Edge и Opera содержат "Chrome", Chrome содержит "Safari",
+# iOS-устройства содержат "Mac OS X", Android содержит "Linux".
+BROWSER_RULES = [
+    (re.compile(r'Edg(?:e|A|iOS)?/'), 'Edge'),
+    (re.compile(r'OPR/|Opera'), 'Opera'),
+    (re.compile(r'YaBrowser/'), 'Yandex'),
+    (re.compile(r'Firefox/|FxiOS/'), 'Firefox'),
+    (re.compile(r'Chrome/|CriOS/|Chromium/'), 'Chrome'),
+    (re.compile(r'Safari/'), 'Safari'),
+    (re.compile(r'MSIE |Trident/'), 'Internet Explorer'),
+]
+
+OS_RULES = [
+    (re.compile(r'iPhone|iPad|iPod'), 'iOS'),
+    (re.compile(r'Android'), 'Android'),
+    (re.compile(r'Windows'), 'Windows'),
+    (re.compile(r'CrOS'), 'ChromeOS'),
+    (re.compile(r'Mac OS X|Macintosh'), 'MacOS'),
+    (re.compile(r'Linux|X11'), 'Linux'),
+]
+
+# Поисковые роботы, мониторинг доступности, проверки балансировщика
+# и HTTP-клиенты без браузера объединены в одно выражение,
+# чтобы строка проверялась за один проход.
+BOT_PATTERN = re.compile(
+    r'bot\b|bot/|crawl|spider|slurp|scrape|'
+    r'monitor|uptime|pingdom|statuscake|site24x7|zabbix|nagios|'
+    r'health.?check|kube-probe|ELB-HealthChecker|'
+    r'curl/|wget/|python-requests|python-urllib|aiohttp|httpx|'
+    r'go-http-client|okhttp|java/|libwww-perl|apache-httpclient|'
+    r'headless|phantomjs|lighthouse',
+    re.IGNORECASE
+)
+
+DEVICE_RULES = [
+    (re.compile(r'iPad|Tablet|Android(?!.*Mobile)'), 'Tablet'),
+    (re.compile(r'Mobile|iPhone|iPod'), 'Mobile'),
+]
+
+
+def _match(rules, user_agent, default):
+    """Возвращает значение первого сработавшего правила."""
+    for pattern, value in rules:
+        if pattern.search(user_agent):
+            return value
+    return default
+
+
+@lru_cache(maxsize=USER_AGENT_CACHE_SIZE)
+def parse_user_agent(user_agent):
+    """Определение браузера, ОС и устройства по строке User-Agent."""
+    # Браузеры всегда передают User-Agent, пустая строка - признак скрипта
+    if not user_agent:
+        return ParsedUserAgent('', '', '', True)
+
+    if BOT_PATTERN.search(user_agent):
+        return ParsedUserAgent('Other', _match(OS_RULES, user_agent, 'Other'), 'Bot', True)
+
+    return ParsedUserAgent(
+        browser=_match(BROWSER_RULES, user_agent, 'Other'),
+        os=_match(OS_RULES, user_agent, 'Other'),
+        device=_match(DEVICE_RULES, user_agent, 'Desktop'),
+        is_bot=False,
+    )
+
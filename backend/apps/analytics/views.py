@@ -1,11 +1,13 @@
 from datetime import datetime, timedelta
-from django.db.models import Count, Sum, Avg, F, Q
+from django.db.models import Sum, Avg, F, Q
+from django.db.models.functions import TruncDate
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
+from core.utils import get_client_ip
 from .models import (
     PageView, UserSession, UserActivity,
     DailyStatistics, UserStatistics, PopularPage
@@ -13,20 +15,46 @@ from .models import (
 from .serializers import (
     PageViewSerializer, UserSessionSerializer, UserActivitySerializer,
     DailyStatisticsSerializer, UserStatisticsSerializer, PopularPageSerializer,
-    DateRangeSerializer, ActivityAnalyticsSerializer
+    DateRangeSerializer, ActivityAnalyticsSerializer, CohortAnalyticsSerializer
 )
-
-
-class PageViewViewSet(viewsets.ModelViewSet):
+from .user_agents import parse_user_agent
+from .ingestion import filter_event
+from .sampling import sample_event
+from .summary import get_user_statistics_summary
+from .dashboard import get_dashboard
+from .dimensions import get_user_agent_id, get_page_url_id
+from .realtime import TOP_PAGES_CAPACITY, get_realtime_activity, record_page_view, get_top_pages
+from .aggregates import daily_activity_counts, day_bounds
+from .cohorts import get_or_schedule_report
+from .export import ExportMixin
+
+
+class PageViewViewSet(ExportMixin, viewsets.ReadOnlyModelViewSet):
     """Представление для работы с просмотрами страниц."""
 
     queryset = PageView.objects.all()
     serializer_class = PageViewSerializer
     permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+    export_filename = 'page_views'
+    export_columns = [
+        ('id', 'id', 'string'),
+        ('user_id', 'user_id', 'string'),
+        ('url', 'url__url', 'string'),
+        ('path', 'path__url', 'string'),
+        ('referer', 'referer__url', 'string'),
+        ('ip_address', 'ip_address', 'string'),
+        ('user_agent_id', 'user_agent_id', 'integer'),
+        ('browser', 'browser', 'string'),
+        ('os', 'os', 'string'),
+        ('device', 'device', 'string'),
+        ('session_id', 'session_id', 'string'),
+        ('sample_weight', 'sample_weight', 'integer'),
+        ('viewed_at', 'viewed_at', 'datetime'),
+    ]
 
     def get_queryset(self):
         """Фильтрация просмотров страниц."""
-        queryset = PageView.objects.all()
+        queryset = PageView.objects.select_related('user', 'user_agent', 'url', 'path', 'referer')
 
         # Фильтрация по пользователю
         user_id = self.request.query_params.get('user')
@@ -36,7 +64,7 @@ class PageViewViewSet(viewsets.ModelViewSet):
         # Фильтрация по URL
         url = self.request.query_params.get('url')
         if url:
-            queryset = queryset.filter(url__icontains=url)
+            queryset = queryset.filter(url__url__icontains=url)
 
         # Фильтрация по дате
         date_from = self.request.query_params.get('date_from')
@@ -64,94 +92,70 @@ class PageViewViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        # Трафик роботов и мониторинга только учитываем в счетчике
+        if filter_event(request, session_id) is not None:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        # Под нагрузкой сохраняется только часть просмотров с весом
+        sample_weight = sample_event()
+        if sample_weight is None:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        # Определяем браузер, ОС и устройство
+        user_agent = request.META.get('HTTP_USER_AGENT', '')
+        parsed_agent = parse_user_agent(user_agent)
+        user_agent_id = get_user_agent_id(user_agent)
+
         # Создаем запись о просмотре страницы
         page_view = PageView(
             user=request.user if request.user.is_authenticated else None,
-            url=url,
-            path=path,
-            referer=referer,
-            ip_address=request.META.get('REMOTE_ADDR', ''),
-            user_agent=request.META.get('HTTP_USER_AGENT', ''),
-            session_id=session_id
+            url_id=get_page_url_id(url),
+            path_id=get_page_url_id(path),
+            referer_id=get_page_url_id(referer),
+            ip_address=get_client_ip(request),
+            user_agent_id=user_agent_id,
+            browser=parsed_agent.browser,
+            os=parsed_agent.os,
+            device=parsed_agent.device,
+            session_id=session_id,
+            sample_weight=sample_weight
         )
 
-        # Определяем браузер, ОС и устройство
-        user_agent = request.META.get('HTTP_USER_AGENT', '')
-        if user_agent:
-            # Здесь можно использовать библиотеку user-agents для определения информации
-            # Но для простоты просто заполняем базовую информацию
-            if 'Chrome' in user_agent:
-                page_view.browser = 'Chrome'
-            elif 'Firefox' in user_agent:
-                page_view.browser = 'Firefox'
-            elif 'Safari' in user_agent:
-                page_view.browser = 'Safari'
-            elif 'Edge' in user_agent:
-                page_view.browser = 'Edge'
-            else:
-                page_view.browser = 'Other'
-
-            if 'Windows' in user_agent:
-                page_view.os = 'Windows'
-            elif 'Mac' in user_agent:
-                page_view.os = 'MacOS'
-            elif 'Linux' in user_agent:
-                page_view.os = 'Linux'
-            elif 'Android' in user_agent:
-                page_view.os = 'Android'
-            elif 'iOS' in user_agent:
-                page_view.os = 'iOS'
-            else:
-                page_view.os = 'Other'
-
-            if 'Mobile' in user_agent:
-                page_view.device = 'Mobile'
-            elif 'Tablet' in user_agent:
-                page_view.device = 'Tablet'
-            else:
-                page_view.device = 'Desktop'
-
+        # Сессии строятся по просмотрам фоновой задачей, поэтому здесь только вставка
         page_view.save()
 
-        # Обновляем или создаем сессию пользователя
-        if session_id:
-            session, created = UserSession.objects.get_or_create(
-                session_id=session_id,
-                defaults={
-                    'user': request.user if request.user.is_authenticated else None,
-                    'ip_address': request.META.get('REMOTE_ADDR', ''),
-                    'user_agent': user_agent,
-                    'browser': page_view.browser,
-                    'os': page_view.os,
-                    'device': page_view.device
-                }
-            )
-
-            if not created:
-                # Обновляем время окончания сессии
-                session.end_time = timezone.now()
-
-                # Обновляем продолжительность сессии
-                if session.start_time:
-                    duration = (session.end_time - session.start_time).total_seconds()
-                    session.duration = int(duration)
-
-                session.save()
+        # Учитываем просмотр в популярных страницах реального времени
+        record_page_view(url, sample_weight)
 
         serializer = self.get_serializer(page_view)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class UserSessionViewSet(viewsets.ReadOnlyModelViewSet):
+class UserSessionViewSet(ExportMixin, viewsets.ReadOnlyModelViewSet):
     """Представление для просмотра сессий пользователей."""
 
     queryset = UserSession.objects.all()
     serializer_class = UserSessionSerializer
     permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+    export_filename = 'user_sessions'
+    export_columns = [
+        ('id', 'id', 'string'),
+        ('user_id', 'user_id', 'string'),
+        ('session_id', 'session_id', 'string'),
+        ('ip_address', 'ip_address', 'string'),
+        ('user_agent_id', 'user_agent_id', 'integer'),
+        ('browser', 'browser', 'string'),
+        ('os', 'os', 'string'),
+        ('device', 'device', 'string'),
+        ('start_time', 'start_time', 'datetime'),
+        ('end_time', 'end_time', 'datetime'),
+        ('duration', 'duration', 'integer'),
+        ('page_count', 'page_count', 'integer'),
+    ]
 
     def get_queryset(self):
         """Фильтрация сессий пользователей."""
-        queryset = UserSession.objects.all()
+        queryset = UserSession.objects.select_related('user', 'user_agent')
 
         # Фильтрация по пользователю
         user_id = self.request.query_params.get('user')
@@ -175,12 +179,25 @@ class UserSessionViewSet(viewsets.ReadOnlyModelViewSet):
         return queryset
 
 
-class UserActivityViewSet(viewsets.ModelViewSet):
+class UserActivityViewSet(ExportMixin, viewsets.ModelViewSet):
     """Представление для работы с активностями пользователей."""
 
     queryset = UserActivity.objects.all()
     serializer_class = UserActivitySerializer
     permission_classes = [permissions.IsAuthenticated]
+    export_filename = 'user_activities'
+    export_columns = [
+        ('id', 'id', 'string'),
+        ('user_id', 'user_id', 'string'),
+        ('activity_type', 'activity_type', 'string'),
+        ('description', 'description', 'string'),
+        ('ip_address', 'ip_address', 'string'),
+        ('user_agent_id', 'user_agent_id', 'integer'),
+        ('content_type', 'content_type', 'string'),
+        ('object_id', 'object_id', 'string'),
+        ('sample_weight', 'sample_weight', 'integer'),
+        ('created_at', 'created_at', 'datetime'),
+    ]
 
     def get_queryset(self):
         """Фильтрация активностей пользователей."""
@@ -193,6 +210,8 @@ class UserActivityViewSet(viewsets.ModelViewSet):
             # Обычные пользователи видят только свои активности
             queryset = UserActivity.objects.filter(user=user)
 
+        queryset = queryset.select_related('user', 'user_agent')
+
         # Фильтрация по пользователю
         user_id = self.request.query_params.get('user')
         if user_id and (user.is_superuser or user.is_staff):
@@ -236,15 +255,21 @@ class UserActivityViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        # Под нагрузкой сохраняется только часть активностей с весом
+        sample_weight = sample_event()
+        if sample_weight is None:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
         # Создаем запись об активности
         activity = UserActivity(
             user=request.user,
             activity_type=activity_type,
             description=description,
-            ip_address=request.META.get('REMOTE_ADDR', ''),
-            user_agent=request.META.get('HTTP_USER_AGENT', ''),
+            ip_address=get_client_ip(request),
+            user_agent_id=get_user_agent_id(request.META.get('HTTP_USER_AGENT', '')),
             content_type=content_type,
-            object_id=object_id
+            object_id=object_id,
+            sample_weight=sample_weight
         )
         activity.save()
 
@@ -413,6 +438,27 @@ class PopularPageViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['get'])
     def top_pages(self, request):
         """Получение топ страниц за период."""
+        # Получаем лимит
+        try:
+            limit = int(request.query_params.get('limit', 10))
+            hours = int(request.query_params.get('hours', 24))
+        except ValueError:
+            return Response(
+                {'error': _('Параметры limit и hours должны быть целыми числами.')},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        limit = max(1, min(limit, TOP_PAGES_CAPACITY))
+
+        # Популярные страницы в реальном времени из Redis
+        if request.query_params.get('realtime') in ['1', 'true']:
+            try:
+                return Response(get_top_pages(limit=limit, hours=hours))
+            except Exception:
+                return Response(
+                    {'error': _('Данные о популярных страницах в реальном времени недоступны.')},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE
+                )
+
         # Валидация параметров запроса
         serializer = DateRangeSerializer(data=request.query_params)
         serializer.is_valid(raise_exception=True)
@@ -420,9 +466,6 @@ class PopularPageViewSet(viewsets.ReadOnlyModelViewSet):
         start_date = serializer.validated_data['start_date']
         end_date = serializer.validated_data['end_date']
 
-        # Получаем лимит
-        limit = int(request.query_params.get('limit', 10))
-
         # Получаем популярные страницы за указанный период
         pages = PopularPage.objects.filter(date__gte=start_date, date__lte=end_date)
 
@@ -455,31 +498,40 @@ class AnalyticsViewSet(viewsets.ViewSet):
         department_id = serializer.validated_data.get('department_id')
         specialization_id = serializer.validated_data.get('specialization_id')
 
-        # Формируем базовый запрос
-        query = Q()
+        if user_id:
+            # Куб активности не хранит разбивку по пользователям,
+            # поэтому для одного пользователя используем исходные записи
+            query = Q(user__id=user_id)
 
-        if activity_type:
-            query &= Q(activity_type=activity_type)
+            if activity_type:
+                query &= Q(activity_type=activity_type)
 
-        if start_date:
-            query &= Q(created_at__date__gte=start_date)
+            if start_date:
+                query &= Q(created_at__gte=day_bounds(start_date)[0])
 
-        if end_date:
-            query &= Q(created_at__date__lte=end_date)
+            if end_date:
+                query &= Q(created_at__lt=day_bounds(end_date)[1])
 
-        if user_id:
-            query &= Q(user__id=user_id)
+            if department_id:
+                query &= Q(user__department__id=department_id)
 
-        if department_id:
-            query &= Q(user__department__id=department_id)
+            if specialization_id:
+                query &= Q(user__specialization__id=specialization_id)
 
-        if specialization_id:
-            query &= Q(user__specialization__id=specialization_id)
-
-        # Получаем данные по дням
-        daily_data = UserActivity.objects.filter(query).extra(
-            select={'day': "DATE(created_at)"}
-        ).values('day', 'activity_type').annotate(count=Count('id')).order_by('day', 'activity_type')
+            daily_data = UserActivity.objects.filter(query).annotate(
+                day=TruncDate('created_at')
+            ).values('day', 'activity_type').annotate(
+                count=Sum('sample_weight')
+            ).order_by('day', 'activity_type')
+        else:
+            # Получаем данные по дням из куба активности
+            daily_data = daily_activity_counts(
+                activity_type=activity_type,
+                start_date=start_date,
+                end_date=end_date,
+                department_id=department_id,
+                specialization_id=specialization_id
+            )
 
         # Группируем данные по дням
         result = {}
@@ -503,105 +555,76 @@ class AnalyticsViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'])
     def user_statistics_summary(self, request):
         """Получение сводной статистики по пользователям."""
-        # Формируем базовый запрос
-        queryset = UserStatistics.objects.all()
-
-        # Фильтрация по отделению
-        department_id = request.query_params.get('department')
-        if department_id:
-            queryset = queryset.filter(user__department__id=department_id)
+        # Все разрезы вычисляются одним запросом и кэшируются по параметрам фильтрации
+        summary = get_user_statistics_summary(
+            department_id=request.query_params.get('department'),
+            specialization_id=request.query_params.get('specialization'),
+            role=request.query_params.get('role')
+        )
 
-        # Фильтрация по специализации
-        specialization_id = request.query_params.get('specialization')
-        if specialization_id:
-            queryset = queryset.filter(user__specialization__id=specialization_id)
+        return Response(summary)
 
-        # Фильтрация по роли
-        role = request.query_params.get('role')
-        if role:
-            queryset = queryset.filter(user__role=role)
+    @action(detail=False, methods=['get'])
+    def dashboard(self, request):
+        """Получение данных для дашборда."""
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            days = 30
+        days = max(1, min(days, 365))
 
-        # Вычисляем агрегированные значения
-        summary = queryset.aggregate(
-            avg_login_count=Avg('login_count'),
-            avg_session_duration=Avg('average_session_duration'),
-            avg_page_views=Avg('total_page_views'),
-            avg_files_uploaded=Avg('files_uploaded'),
-            avg_files_downloaded=Avg('files_downloaded'),
-            avg_tests_started=Avg('tests_started'),
-            avg_tests_completed=Avg('tests_completed'),
-            avg_tests_passed=Avg('tests_passed'),
-            total_users=Count('id')
-        )
+        return Response(get_dashboard(days))
 
-        # Добавляем дополнительные данные
-        summary['users_by_role'] = list(
-            queryset.values('user__role').annotate(count=Count('id'))
-        )
+    @action(detail=False, methods=['get'])
+    def realtime(self, request):
+        """Получение активных пользователей в реальном времени."""
+        try:
+            data = get_realtime_activity()
+        except Exception:
+            return Response(
+                {'error': _('Данные об активности в реальном времени недоступны.')},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
 
-        summary['users_by_department'] = list(
-            queryset.values('user__department__name').annotate(count=Count('id'))
-        )
+        return Response(data)
 
-        summary['users_by_specialization'] = list(
-            queryset.values('user__specialization__name').annotate(count=Count('id'))
-        )
+    def _cohort_report(self, request, kind):
+        """Получение когортного отчета или воронки из кэша."""
+        serializer = CohortAnalyticsSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
 
-        return Response(summary)
+        # По умолчанию анализируем последние 12 недель
+        end_date = serializer.validated_data.get('end_date') or timezone.localdate()
+        start_date = serializer.validated_data.get('start_date') or end_date - timedelta(weeks=12)
 
-    @action(detail=False, methods=['get'])
-    def dashboard(self, request):
-        """Получение данных для дашборда."""
-        # Получаем данные за последние 30 дней
-        end_date = timezone.now().date()
-        start_date = end_date - timedelta(days=29)
-
-        # Получаем ежедневную статистику
-        daily_stats = DailyStatistics.objects.filter(
-            date__gte=start_date,
-            date__lte=end_date
-        ).order_by('date')
-
-        # Получаем пользовательскую статистику
-        user_stats = UserStatistics.objects.all()
-
-        # Получаем популярные страницы
-        popular_pages = PopularPage.objects.filter(
-            date__gte=start_date,
-            date__lte=end_date
-        ).values('url', 'title').annotate(
-            total_views=Sum('views_count')
-        ).order_by('-total_views')[:5]
-
-        # Формируем сводные данные
-        summary = daily_stats.aggregate(
-            total_views=Sum('total_views'),
-            unique_visitors=Sum('unique_visitors'),
-            new_users=Sum('new_users'),
-            average_session_duration=Avg('average_session_duration'),
-            files_uploaded=Sum('files_uploaded'),
-            files_downloaded=Sum('files_downloaded'),
-            tests_started=Sum('tests_started'),
-            tests_completed=Sum('tests_completed')
-        )
+        if start_date > end_date:
+            return Response(
+                {'error': _('Дата начала не может быть позже даты окончания.')},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        # Формируем результат
-        result = {
-            'summary': summary,
-            'daily_stats': DailyStatisticsSerializer(daily_stats, many=True).data,
-            'popular_pages': list(popular_pages),
-            'active_users': user_stats.count(),
-            'users_by_role': list(
-                user_stats.values('user__role').annotate(count=Count('id'))
-            ),
-            'users_by_department': list(
-                user_stats.values('user__department__name').annotate(count=Count('id'))
-            ),
-            'period': {
-                'start_date': start_date.strftime('%Y-%m-%d'),
-                'end_date': end_date.strftime('%Y-%m-%d'),
-                'days': 30
-            }
+        params = {
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat()
         }
+        if kind == 'cohorts':
+            params['periods'] = serializer.validated_data['periods']
+
+        report = get_or_schedule_report(kind, params)
+        if report is None:
+            return Response(
+                {'status': 'pending', 'params': params},
+                status=status.HTTP_202_ACCEPTED
+            )
 
-        return Response(result)
\ No newline at end of file
+        return Response(report)
+
+    @action(detail=False, methods=['get'])
+    def cohorts(self, request):
+        """Получение когортного анализа удержания по неделям."""
+        return self._cohort_report(request, 'cohorts')
+
+    @action(detail=False, methods=['get'])
+    def funnel(self, request):
+        """Получение воронки прохождения тестов."""
+        return self._cohort_report(request, 'funnel')
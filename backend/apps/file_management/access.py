@@ -0,0 +1,69 @@
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Q
+
+from .models import File, FileAccess
+
+# Ключ кэша выданных пользователю прав на файлы
+GRANTED_FILES_CACHE_KEY = 'file_management:granted_files:{user_id}'
+
+# Время жизни кэша прав (в секундах); изменения FileAccess сбрасывают его сразу
+GRANTED_FILES_CACHE_TIMEOUT = 60 * 60
+
+
+def visible_files_q(user, file_ref='pk', prefix=''):
+    """Условие видимости файла для пользователя.
+
+    Права на просмотр проверяются подзапросом EXISTS, поэтому выборка
+    не размножает строки по FileAccess и не требует DISTINCT.
+    file_ref и prefix задают путь к файлу для связанных моделей.
+    """
+    has_view_access = FileAccess.objects.filter(
+        file_id=OuterRef(file_ref),
+        user=user,
+        permission_type=FileAccess.PermissionType.VIEW
+    )
+    return (
+        Q(**{f'{prefix}access_level': File.AccessLevel.PUBLIC}) |
+        Q(**{f'{prefix}owner': user}) |
+        Q(Exists(has_view_access))
+    )
+
+
+def get_granted_files(user, request=None):
+    """Выданные пользователю права: тип разрешения -> множество id файлов.
+
+    Значение кэшируется на пользователя, а в пределах запроса
+    запоминается в самом запросе, чтобы проверка прав для списка
+    объектов не обращалась к кэшу и базе для каждого объекта.
+    """
+    if request is not None and hasattr(request, '_granted_files'):
+        return request._granted_files
+
+    key = GRANTED_FILES_CACHE_KEY.format(user_id=user.pk)
+    granted = cache.get(key)
+    if granted is None:
+        granted = defaultdict(set)
+        rows = FileAccess.objects.filter(user=user).values_list('permission_type', 'file_id')
+        for permission_type, file_id in rows:
+            granted[permission_type].add(file_id)
+        granted = dict(granted)
+        cache.set(key, granted, GRANTED_FILES_CACHE_TIMEOUT)
+
+    if request is not None:
+        request._granted_files = granted
+    return granted
+
+
+def has_granted_access(user, file_id, permission_type=None, request=None):
+    """Проверка выданного права на файл; без типа подходит любое право."""
+    granted = get_granted_files(user, request)
+    if permission_type is None:
+        return any(file_id in file_ids for file_ids in granted.values())
+    return file_id in granted.get(permission_type, ())
+
+
+def invalidate_granted_files(user_id):
+    """Сброс кэша прав пользователя после изменения FileAccess."""
+    cache.delete(GRANTED_FILES_CACHE_KEY.format(user_id=user_id))
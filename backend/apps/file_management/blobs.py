@@ -0,0 +1,84 @@
+import logging
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import FileBlob
+from .previews import schedule_previews
+from .search import schedule_text_extraction
+
+logger = logging.getLogger('app')
+
+
+def retain_blob(blob):
+    """Добавление ссылки на существующий блоб."""
+    FileBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+    return blob
+
+
+def _retain_by_checksum(checksum):
+    """Добавление ссылки на блоб с контрольной суммой, если он существует.
+
+    Счетчик увеличивается до чтения блоба, поэтому одновременное
+    освобождение последней ссылки не удалит его.
+    """
+    if FileBlob.objects.filter(checksum=checksum).update(ref_count=F('ref_count') + 1):
+        return FileBlob.objects.get(checksum=checksum)
+    return None
+
+
+def acquire_blob(content, checksum, mime_type='', size=0):
+    """Получение блоба для загруженного содержимого со ссылкой на него.
+
+    Если блоб с такой контрольной суммой уже есть, содержимое не записывается
+    и добавляется только ссылка. Иначе содержимое сохраняется в хранилище
+    по пути, построенному из контрольной суммы.
+    """
+    blob = _retain_by_checksum(checksum)
+    if blob is not None:
+        return blob
+
+    blob = FileBlob(checksum=checksum, mime_type=mime_type, size=size, ref_count=1)
+    blob.content.save(content.name, content, save=False)
+
+    try:
+        with transaction.atomic():
+            blob.save()
+    except IntegrityError:
+        # Такое же содержимое одновременно сохранил другой запрос
+        blob.content.delete(save=False)
+        return _retain_by_checksum(checksum)
+    except Exception:
+        blob.content.delete(save=False)
+        raise
+
+    # Превью и текст для поиска строятся один раз для нового содержимого
+    schedule_previews(blob)
+    schedule_text_extraction(blob)
+    return blob
+
+
+def release_blob(blob_id):
+    """Удаление ссылки на блоб.
+
+    Блоб без ссылок удаляется вместе с содержимым и превью после фиксации
+    транзакции.
+    """
+    with transaction.atomic():
+        FileBlob.objects.filter(pk=blob_id, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+        blob = FileBlob.objects.select_for_update().filter(pk=blob_id, ref_count__lte=0).first()
+        if blob is None:
+            return
+
+        names = [blob.content.name] + list(blob.previews.values_list('image', flat=True))
+        storage = blob.content.storage
+        blob.delete()
+
+    def delete_content():
+        for name in names:
+            try:
+                storage.delete(name)
+            except Exception as e:
+                logger.warning(f"Не удалось удалить содержимое блоба {name}: {e}")
+
+    transaction.on_commit(delete_content)
@@ -0,0 +1,228 @@
+import mimetypes
+import os
+import posixpath
+import re
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.http import (
+    content_disposition_header, http_date, parse_etags, parse_http_date_safe, quote_etag
+)
+
+# Размер блока чтения при отдаче части файла
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Один диапазон байт: "bytes=начало-конец", "bytes=начало-" или "bytes=-длина"
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Соль HMAC подписанных ссылок на скачивание
+SIGNED_DOWNLOAD_SALT = 'apps.file_management.signed_download'
+
+
+class RangeNotSatisfiable(Exception):
+    """Запрошенный диапазон не может быть отдан."""
+
+
+def accel_redirect_path(field_file):
+    """Путь файла во внутреннем location nginx."""
+    prefix = settings.FILE_DOWNLOAD_ACCEL_PREFIX.rstrip('/')
+    return quote(f"{prefix}/{field_file.name.lstrip('/')}")
+
+
+def download_signature(path, expires, user_id, filename=''):
+    """Подпись HMAC-SHA256 пути файла, времени истечения, пользователя и имени файла."""
+    value = f"{path}:{expires}:{user_id}:{filename}"
+    return salted_hmac(SIGNED_DOWNLOAD_SALT, value, algorithm='sha256').hexdigest()
+
+
+def sign_download(path, user_id, filename='', ttl=None):
+    """Параметры подписанной ссылки на скачивание файла хранилища."""
+    ttl = settings.FILE_SIGNED_URL_TTL if ttl is None else ttl
+    expires = int(time.time()) + ttl
+    return {
+        'expires': expires,
+        'uid': user_id,
+        'name': filename,
+        'signature': download_signature(path, expires, user_id, filename)
+    }
+
+
+def verify_download(path, expires, user_id, signature, filename=''):
+    """Проверка подписанной ссылки без обращения к базе данных."""
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+
+    if expires < time.time():
+        return False
+
+    # Подписываются только нормализованные относительные пути
+    if not path or path != posixpath.normpath(path) or path.startswith(('/', '..')):
+        return False
+
+    return constant_time_compare(download_signature(path, expires, user_id, filename), signature or '')
+
+
+def is_not_modified(request, etag=None, last_modified=None):
+    """Проверка условных заголовков If-None-Match и If-Modified-Since."""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        # If-Modified-Since не учитывается, если передан If-None-Match
+        if etag is None:
+            return False
+        etags = parse_etags(if_none_match)
+        return '*' in etags or quote_etag(etag) in etags
+
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    if if_modified_since is not None and last_modified is not None:
+        return int(last_modified.timestamp()) <= if_modified_since
+
+    return False
+
+
+def _if_range_matches(request, etag=None, last_modified=None):
+    """Проверка If-Range: диапазон отдается, только если файл не изменился."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # Для диапазонов допустимо только строгое сравнение
+        return etag is not None and if_range == quote_etag(etag)
+
+    if_range_date = parse_http_date_safe(if_range)
+    return (
+        if_range_date is not None
+        and last_modified is not None
+        and int(last_modified.timestamp()) == if_range_date
+    )
+
+
+def parse_range(request, size, etag=None, last_modified=None):
+    """Диапазон байт (начало, конец включительно) из заголовка Range.
+
+    Возвращает None, если нужно отдать файл целиком: заголовка нет,
+    он не разобран или не прошел проверку If-Range. Для нескольких
+    диапазонов и диапазонов за пределами файла выбрасывается
+    RangeNotSatisfiable.
+    """
+    header = request.META.get('HTTP_RANGE', '').strip()
+    if not header:
+        return None
+
+    if not _if_range_matches(request, etag, last_modified):
+        return None
+
+    if ',' in header:
+        raise RangeNotSatisfiable()
+
+    match = RANGE_PATTERN.match(header.replace(' ', ''))
+    if match is None:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+
+    if not start:
+        # Последние N байт файла
+        length = int(end)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+
+    return start, end
+
+
+def _read_range(f, start, end):
+    """Чтение части файла блоками.
+
+    Файл закрывается по окончании чтения или при закрытии ответа,
+    который закрывает незавершенный генератор.
+    """
+    try:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(DOWNLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def file_response(request, field_file, etag=None, last_modified=None, filename=None, as_attachment=True):
+    """Ответ со скачиваемым файлом с поддержкой Range и условных запросов.
+
+    При совпадении ETag или даты изменения возвращается 304 без тела.
+    Один диапазон из заголовка Range отдается ответом 206, несколько
+    диапазонов отклоняются ответом 416.
+
+    Если включен FILE_DOWNLOAD_ACCEL_REDIRECT, содержимое не читается:
+    ответ содержит только заголовок X-Accel-Redirect, а файл и запрошенный
+    диапазон отдает nginx. Иначе файл отдается Django.
+
+    В атрибуте download_start ответа сохраняется смещение, с которого
+    начинается отдача, или None, если содержимое не отдается.
+
+    filename задает имя файла у пользователя; без него используется
+    имя в хранилище.
+    """
+    filename = filename or os.path.basename(field_file.name)
+
+    validators = {}
+    if etag is not None:
+        validators['ETag'] = quote_etag(etag)
+    if last_modified is not None:
+        validators['Last-Modified'] = http_date(last_modified.timestamp())
+
+    if is_not_modified(request, etag, last_modified):
+        response = HttpResponseNotModified()
+        for header, value in validators.items():
+            response[header] = value
+        response.download_start = None
+        return response
+
+    size = field_file.size
+    try:
+        byte_range = parse_range(request, size, etag, last_modified)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        response.download_start = None
+        return response
+
+    content_type, encoding = mimetypes.guess_type(field_file.name)
+    content_type = content_type or 'application/octet-stream'
+
+    if settings.FILE_DOWNLOAD_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = accel_redirect_path(field_file)
+    elif byte_range is not None:
+        start, end = byte_range
+        f = field_file.open('rb')
+        response = StreamingHttpResponse(_read_range(f, start, end), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        response = FileResponse(field_file, content_type=content_type)
+        response['Content-Length'] = str(size)
+
+    for header, value in validators.items():
+        response[header] = value
+    response['Accept-Ranges'] = 'bytes'
+    # Имена не в ASCII передаются в filename* по RFC 5987
+    response['Content-Disposition'] = content_disposition_header(as_attachment, filename)
+    response.download_start = byte_range[0] if byte_range else 0
+    return response
@@ -0,0 +1,107 @@
+import hashlib
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from apps.file_management.models import File, FileBlob, FileVersion
+
+
+def _storage_checksum(name):
+    """Контрольная сумма SHA-256 и размер файла в хранилище."""
+    sha256 = hashlib.sha256()
+    size = 0
+    with default_storage.open(name, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(chunk)
+            size += len(chunk)
+    return sha256.hexdigest(), size
+
+
+def _is_referenced(name):
+    """Проверка, что на файл хранилища ссылается файл, версия или блоб."""
+    return (
+        File.objects.filter(file=name).exists()
+        or FileVersion.objects.filter(file_content=name).exists()
+        or FileBlob.objects.filter(content=name).exists()
+    )
+
+
+class Command(BaseCommand):
+    """Команда Django для перевода существующих файлов на общие блобы."""
+
+    help = 'Объединить одинаковые файлы в общие блобы и удалить дубликаты из хранилища'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, сколько места освободится'
+        )
+
+    def handle(self, *args, **options):
+        """Выполнение команды."""
+        dry_run = options['dry_run']
+        checksums = {}
+        planned_blobs = {}
+        planned_removals = set()
+        linked = 0
+        removed = 0
+        reclaimed = 0
+
+        rows = [
+            (File, 'file', File.objects.filter(blob__isnull=True).order_by('created_at')),
+            (FileVersion, 'file_content', FileVersion.objects.filter(blob__isnull=True).order_by('created_at')),
+        ]
+
+        for model, field_name, queryset in rows:
+            for pk, name in queryset.values_list('pk', field_name).iterator():
+                if not name or not default_storage.exists(name):
+                    self.stdout.write(self.style.WARNING(f'Файл отсутствует в хранилище: {name}'))
+                    continue
+
+                # Контрольная сумма одного и того же файла хранилища считается один раз
+                if name not in checksums:
+                    checksums[name] = _storage_checksum(name)
+                checksum, size = checksums[name]
+
+                if dry_run:
+                    blob_name = FileBlob.objects.filter(checksum=checksum).values_list('content', flat=True).first()
+                    blob_name = blob_name or planned_blobs.setdefault(checksum, name)
+                    if blob_name != name and name not in planned_removals:
+                        planned_removals.add(name)
+                        removed += 1
+                        reclaimed += size
+                    linked += 1
+                    continue
+
+                with transaction.atomic():
+                    blob = FileBlob.objects.select_for_update().filter(checksum=checksum).first()
+                    if blob is None:
+                        # Первая копия содержимого становится блобом без перезаписи
+                        blob = FileBlob.objects.create(
+                            checksum=checksum,
+                            content=name,
+                            size=size,
+                            ref_count=0
+                        )
+
+                    updates = {'blob': blob, field_name: blob.content.name}
+                    if model is File:
+                        updates['checksum'] = checksum
+                    model.objects.filter(pk=pk).update(**updates)
+                    FileBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+
+                linked += 1
+
+                # Дубликат удаляется, когда на него больше никто не ссылается
+                if name != blob.content.name and not _is_referenced(name):
+                    default_storage.delete(name)
+                    removed += 1
+                    reclaimed += size
+
+        prefix = 'Будет' if dry_run else 'Готово:'
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix} привязано записей: {linked}, удалено дубликатов: {removed}, '
+            f'освобождено: {reclaimed / (1024 * 1024):.1f} МБ'
+        ))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from apps.file_management.models import File, FileBlob
+from apps.file_management.search import extract_text, supports_text_extraction, update_search_vectors
+
+
+class Command(BaseCommand):
+    """Команда Django для заполнения поискового индекса файлов."""
+
+    help = 'Извлечь текст из содержимого без текста и пересчитать поисковые векторы файлов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reextract',
+            action='store_true',
+            help='Извлечь текст заново для всех блобов'
+        )
+
+    def handle(self, *args, **options):
+        """Выполнение команды."""
+        blobs = FileBlob.objects.all()
+        if not options['reextract']:
+            blobs = blobs.filter(text_extracted=False)
+
+        extracted = 0
+        failed = 0
+        for blob in blobs.iterator():
+            if not supports_text_extraction(blob.mime_type):
+                continue
+
+            try:
+                text = extract_text(blob)
+            except Exception as e:
+                self.stdout.write(self.style.WARNING(f'Не удалось извлечь текст {blob.checksum}: {e}'))
+                failed += 1
+                continue
+
+            FileBlob.objects.filter(pk=blob.pk).update(text_content=text, text_extracted=True)
+            extracted += 1
+
+        updated = update_search_vectors(File.objects.all())
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Извлечен текст: {extracted}, ошибок: {failed}, обновлено поисковых векторов: {updated}'
+        ))
@@ -1,11 +1,18 @@
 import os
 import uuid
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from django.utils.translation import gettext_lazy as _
 
 User = get_user_model()
 
+# Поля файла, от которых зависит поисковый вектор
+SEARCH_VECTOR_FIELDS = {'title', 'description', 'blob', 'blob_id'}
+
 
 def file_upload_path(instance, filename):
     """Определение пути загрузки файла."""
@@ -14,6 +21,74 @@ def file_upload_path(instance, filename):
     return os.path.join('documents', instance.file_type, filename)
 
 
+def blob_upload_path(instance, filename):
+    """Определение пути блоба по контрольной сумме содержимого."""
+    ext = filename.split('.')[-1] if '.' in filename else 'bin'
+    checksum = instance.checksum
+    return os.path.join('blobs', checksum[:2], checksum[2:4], f"{checksum}.{ext}")
+
+
+class FileBlob(models.Model):
+    """Модель блоба - общего содержимого файлов с одинаковой контрольной суммой."""
+
+    checksum = models.CharField(_('Контрольная сумма'), max_length=64, unique=True)
+    content = models.FileField(_('Содержимое'), upload_to=blob_upload_path, max_length=255)
+    size = models.PositiveBigIntegerField(_('Размер'), default=0)
+    mime_type = models.CharField(_('MIME тип'), max_length=100, blank=True)
+    ref_count = models.PositiveIntegerField(_('Количество ссылок'), default=0)
+    text_content = models.TextField(_('Извлеченный текст'), blank=True)
+    text_extracted = models.BooleanField(_('Текст извлечен'), default=False)
+    preview_failed = models.BooleanField(_('Ошибка построения превью'), default=False)
+    created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('Блоб файла')
+        verbose_name_plural = _('Блобы файлов')
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.checksum} ({self.ref_count})"
+
+
+def preview_upload_path(instance, filename):
+    """Определение пути превью рядом с блобом по его контрольной сумме."""
+    checksum = instance.blob.checksum
+    return os.path.join('blobs', checksum[:2], checksum[2:4], f"{checksum}.{instance.size}.jpg")
+
+
+class FilePreview(models.Model):
+    """Модель превью содержимого блоба.
+
+    Превью строится один раз на контрольную сумму и общее для всех
+    файлов и версий с таким содержимым.
+    """
+
+    class PreviewSize(models.TextChoices):
+        SMALL = 'small', _('Маленькое')
+        MEDIUM = 'medium', _('Среднее')
+        LARGE = 'large', _('Большое')
+
+    blob = models.ForeignKey(
+        FileBlob,
+        verbose_name=_('Блоб'),
+        related_name='previews',
+        on_delete=models.CASCADE
+    )
+    size = models.CharField(_('Размер превью'), max_length=10, choices=PreviewSize.choices)
+    image = models.FileField(_('Изображение'), upload_to=preview_upload_path, max_length=255)
+    width = models.PositiveIntegerField(_('Ширина'), default=0)
+    height = models.PositiveIntegerField(_('Высота'), default=0)
+    created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('Превью файла')
+        verbose_name_plural = _('Превью файлов')
+        unique_together = ['blob', 'size']
+
+    def __str__(self):
+        return f"{self.blob.checksum} - {self.get_size_display()}"
+
+
 class FileCategory(models.Model):
     """Модель категории файлов."""
 
@@ -54,6 +129,7 @@ class File(models.Model):
     title = models.CharField(_('Название'), max_length=255)
     description = models.TextField(_('Описание'), blank=True)
     file = models.FileField(_('Файл'), upload_to=file_upload_path)
+    original_filename = models.CharField(_('Исходное имя файла'), max_length=255, blank=True)
     file_size = models.PositiveIntegerField(_('Размер файла'), default=0)
     file_type = models.CharField(
         _('Тип файла'),
@@ -85,15 +161,33 @@ class File(models.Model):
     created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
     updated_at = models.DateTimeField(_('Дата обновления'), auto_now=True)
     checksum = models.CharField(_('Контрольная сумма'), max_length=64, blank=True)
+    blob = models.ForeignKey(
+        FileBlob,
+        verbose_name=_('Блоб'),
+        related_name='files',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True
+    )
+    search_vector = SearchVectorField(_('Поисковый вектор'), null=True, editable=False)
 
     class Meta:
         verbose_name = _('Файл')
         verbose_name_plural = _('Файлы')
         ordering = ['-created_at']
+        indexes = [
+            GinIndex(fields=['search_vector']),
+        ]
 
     def __str__(self):
         return self.title
 
+    def get_download_name(self):
+        """Имя файла при скачивании: исходное или название с расширением содержимого."""
+        if self.original_filename:
+            return self.original_filename
+        return f"{self.title}{os.path.splitext(self.file.name)[1]}"
+
     def save(self, *args, **kwargs):
         """Переопределение метода сохранения для вычисления размера файла."""
         if self.file and not self.file_size and hasattr(self.file, 'size'):
@@ -197,6 +291,7 @@ class FileVersion(models.Model):
         on_delete=models.CASCADE
     )
     file_content = models.FileField(_('Содержимое файла'), upload_to=file_upload_path)
+    original_filename = models.CharField(_('Исходное имя файла'), max_length=255, blank=True)
     version_number = models.PositiveIntegerField(_('Номер версии'))
     created_by = models.ForeignKey(
         User,
@@ -206,6 +301,14 @@ class FileVersion(models.Model):
     )
     comment = models.TextField(_('Комментарий'), blank=True)
     created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
+    blob = models.ForeignKey(
+        FileBlob,
+        verbose_name=_('Блоб'),
+        related_name='versions',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True
+    )
 
     class Meta:
         verbose_name = _('Версия файла')
@@ -216,6 +319,82 @@ class FileVersion(models.Model):
     def __str__(self):
         return f"{self.file} - версия {self.version_number}"
 
+    def get_download_name(self):
+        """Имя версии при скачивании: исходное или название файла с расширением содержимого."""
+        if self.original_filename:
+            return self.original_filename
+        return f"{self.file.title}{os.path.splitext(self.file_content.name)[1]}"
+
+
+class UploadSession(models.Model):
+    """Модель сессии возобновляемой загрузки файла по частям."""
+
+    class SessionStatus(models.TextChoices):
+        ACTIVE = 'active', _('Активна')
+        COMPLETED = 'completed', _('Завершена')
+        ABORTED = 'aborted', _('Отменена')
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(
+        User,
+        verbose_name=_('Владелец'),
+        related_name='upload_sessions',
+        on_delete=models.CASCADE
+    )
+    filename = models.CharField(_('Имя файла'), max_length=255)
+    total_size = models.PositiveBigIntegerField(_('Размер файла'))
+    offset = models.PositiveBigIntegerField(_('Получено байт'), default=0)
+    status = models.CharField(
+        _('Статус'),
+        max_length=20,
+        choices=SessionStatus.choices,
+        default=SessionStatus.ACTIVE
+    )
+
+    # Метаданные создаваемого файла
+    title = models.CharField(_('Название'), max_length=255)
+    description = models.TextField(_('Описание'), blank=True)
+    file_type = models.CharField(
+        _('Тип файла'),
+        max_length=20,
+        choices=File.FileType.choices,
+        default=File.FileType.DOCUMENT
+    )
+    category = models.ForeignKey(
+        FileCategory,
+        verbose_name=_('Категория'),
+        related_name='+',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True
+    )
+    access_level = models.CharField(
+        _('Уровень доступа'),
+        max_length=20,
+        choices=File.AccessLevel.choices,
+        default=File.AccessLevel.RESTRICTED
+    )
+
+    file = models.ForeignKey(
+        File,
+        verbose_name=_('Файл'),
+        related_name='+',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True
+    )
+    created_at = models.DateTimeField(_('Дата создания'), auto_now_add=True)
+    updated_at = models.DateTimeField(_('Дата обновления'), auto_now=True)
+    expires_at = models.DateTimeField(_('Действует до'))
+
+    class Meta:
+        verbose_name = _('Сессия загрузки')
+        verbose_name_plural = _('Сессии загрузки')
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.filename} - {self.offset}/{self.total_size}"
+
 
 class FileDownloadHistory(models.Model):
     """Модель истории скачивания файла."""
@@ -242,4 +421,58 @@ class FileDownloadHistory(models.Model):
         ordering = ['-downloaded_at']
 
     def __str__(self):
-        return f"{self.file} - {self.user} - {self.downloaded_at}"
\ No newline at end of file
+        return f"{self.file} - {self.user} - {self.downloaded_at}"
+
+
+@receiver(post_delete, sender=File)
+@receiver(post_delete, sender=FileVersion)
+def release_file_blob(sender, instance, **kwargs):
+    """Освобождение ссылки на блоб при удалении файла или версии."""
+    if instance.blob_id:
+        from .blobs import release_blob
+        release_blob(instance.blob_id)
+
+
+@receiver(pre_save, sender=FileAccess)
+def remember_file_access_user(sender, instance, **kwargs):
+    """Запоминание прежнего пользователя права перед его изменением."""
+    instance._previous_user_id = None
+    if instance.pk:
+        instance._previous_user_id = FileAccess.objects.filter(
+            pk=instance.pk
+        ).values_list('user_id', flat=True).first()
+
+
+@receiver(post_save, sender=FileAccess)
+@receiver(post_delete, sender=FileAccess)
+def invalidate_file_access_cache(sender, instance, **kwargs):
+    """Сброс кэша прав пользователя при изменении доступа к файлу.
+
+    Если право передано другому пользователю, сбрасывается кэш обоих.
+    Сброс выполняется после фиксации транзакции, чтобы параллельный
+    запрос не закэшировал права заново по еще не измененным строкам.
+    """
+    from .access import invalidate_granted_files
+
+    user_ids = {instance.user_id, instance.__dict__.pop('_previous_user_id', None)} - {None}
+
+    def invalidate():
+        for user_id in user_ids:
+            invalidate_granted_files(user_id)
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=File)
+def update_file_search_vector(sender, instance, created, update_fields=None, **kwargs):
+    """Обновление поискового вектора после сохранения файла.
+
+    Вектор пересчитывается только для нового файла или при изменении
+    полей, по которым он строится. Изменение извлеченного текста
+    содержимого обновляет векторы в задаче извлечения.
+    """
+    if not created and update_fields is not None and not SEARCH_VECTOR_FIELDS & set(update_fields):
+        return
+
+    from .search import update_search_vectors
+    update_search_vectors(File.objects.filter(pk=instance.pk))
@@ -1,5 +1,7 @@
 from rest_framework import permissions
 
+from .access import has_granted_access
+
 
 class IsFileOwner(permissions.BasePermission):
     """
@@ -21,6 +23,9 @@ class IsFileOwner(permissions.BasePermission):
 class HasFileAccess(permissions.BasePermission):
     """
     Разрешение, проверяющее, имеет ли пользователь доступ к файлу.
+
+    Выданные права берутся из кэшированного набора файлов пользователя,
+    поэтому проверка не делает запрос к базе для каждого объекта.
     """
 
     def has_object_permission(self, request, view, obj):
@@ -33,7 +38,7 @@ class HasFileAccess(permissions.BasePermission):
         # Если объект - файл
         if hasattr(obj, 'access_level'):
             # Владелец файла имеет полный доступ
-            if obj.owner == user:
+            if obj.owner_id == user.pk:
                 return True
 
             # Проверяем уровень доступа файла
@@ -42,23 +47,23 @@ class HasFileAccess(permissions.BasePermission):
 
             # Проверяем наличие права доступа
             if view.action == 'download':
-                return obj.access_rights.filter(user=user, permission_type='view').exists()
+                return has_granted_access(user, obj.pk, 'view', request)
 
             if view.action in ['update', 'partial_update']:
-                return obj.access_rights.filter(user=user, permission_type='edit').exists()
+                return has_granted_access(user, obj.pk, 'edit', request)
 
             if view.action == 'destroy':
-                return obj.access_rights.filter(user=user, permission_type='delete').exists()
+                return has_granted_access(user, obj.pk, 'delete', request)
 
             # Для просмотра достаточно любого права доступа
-            return obj.access_rights.filter(user=user).exists()
+            return has_granted_access(user, obj.pk, request=request)
 
         # Если объект - версия файла
         if hasattr(obj, 'file'):
             file_obj = obj.file
 
             # Владелец файла имеет полный доступ
-            if file_obj.owner == user:
+            if file_obj.owner_id == user.pk:
                 return True
 
             # Проверяем уровень доступа файла
@@ -67,10 +72,10 @@ class HasFileAccess(permissions.BasePermission):
 
             # Для создания новой версии нужно право на редактирование
             if view.action == 'create':
-                return file_obj.access_rights.filter(user=user, permission_type='edit').exists()
+                return has_granted_access(user, file_obj.pk, 'edit', request)
 
             # Для просмотра достаточно права на просмотр
-            return file_obj.access_rights.filter(user=user, permission_type='view').exists()
+            return has_granted_access(user, file_obj.pk, 'view', request)
 
         return False
 
@@ -0,0 +1,169 @@
+import io
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from PIL import Image, ImageOps
+
+from .models import FileBlob, FilePreview
+
+logger = logging.getLogger('app')
+
+# Максимальная сторона превью каждого размера (в пикселях)
+PREVIEW_SIZES = {
+    FilePreview.PreviewSize.SMALL: 160,
+    FilePreview.PreviewSize.MEDIUM: 480,
+    FilePreview.PreviewSize.LARGE: 1024,
+}
+
+# Качество JPEG превью
+PREVIEW_QUALITY = 85
+
+# Растровые форматы изображений, которые декодирует Pillow
+PREVIEW_IMAGE_MIME_TYPES = {
+    'image/jpeg',
+    'image/png',
+    'image/gif',
+    'image/webp',
+    'image/bmp',
+    'image/tiff',
+}
+
+# MIME тип PDF документов, для которых строится превью первой страницы
+PDF_MIME_TYPE = 'application/pdf'
+
+# Ограничение времени отрисовки страницы PDF (в секундах)
+PDF_RENDER_TIMEOUT = 60
+
+# Время, в течение которого повторный запрос не ставит задачу снова (в секундах)
+PREVIEW_LOCK_TIMEOUT = 5 * 60
+
+# Ключ блокировки построения превью блоба
+PREVIEW_LOCK_KEY = 'file_management:preview_lock:{blob_id}'
+
+
+def supports_preview(mime_type):
+    """Проверка, строится ли превью для содержимого с таким MIME типом."""
+    return mime_type in PREVIEW_IMAGE_MIME_TYPES or mime_type == PDF_MIME_TYPE
+
+
+def schedule_previews(blob):
+    """Постановка задачи построения превью после фиксации транзакции."""
+    if not supports_preview(blob.mime_type):
+        return False
+
+    from .tasks import generate_file_previews
+    blob_id = blob.pk
+    transaction.on_commit(lambda: generate_file_previews.delay(blob_id))
+    return True
+
+
+def mark_preview_failed(blob_id):
+    """Отметка блоба, превью которого построить не удалось."""
+    FileBlob.objects.filter(pk=blob_id).update(preview_failed=True)
+
+
+def request_previews(blob):
+    """Постановка задачи для блоба без превью не чаще раза в PREVIEW_LOCK_TIMEOUT."""
+    if blob.preview_failed:
+        return False
+    if not cache.add(PREVIEW_LOCK_KEY.format(blob_id=blob.pk), True, PREVIEW_LOCK_TIMEOUT):
+        return False
+    return schedule_previews(blob)
+
+
+def _render_pdf_page(blob):
+    """Отрисовка первой страницы PDF через pdftoppm."""
+    pdftoppm = shutil.which('pdftoppm')
+    if pdftoppm is None:
+        logger.warning("pdftoppm не найден, превью PDF не строятся")
+        return None
+
+    scale = max(PREVIEW_SIZES.values())
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = os.path.join(tmpdir, 'source.pdf')
+        with blob.content.open('rb') as src, open(source, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+
+        output = os.path.join(tmpdir, 'page')
+        subprocess.run(
+            [pdftoppm, '-f', '1', '-l', '1', '-singlefile', '-png', '-scale-to', str(scale), source, output],
+            check=True,
+            capture_output=True,
+            timeout=PDF_RENDER_TIMEOUT
+        )
+
+        image = Image.open(f"{output}.png")
+        image.load()
+        return image
+
+
+def _open_image(blob):
+    """Открытие изображения с учетом ориентации из EXIF."""
+    with blob.content.open('rb') as f:
+        image = Image.open(f)
+        # Для JPEG декодируется сразу уменьшенное изображение
+        image.draft('RGB', (max(PREVIEW_SIZES.values()),) * 2)
+        image.load()
+    return ImageOps.exif_transpose(image)
+
+
+def _to_rgb(image):
+    """Приведение изображения к RGB с белым фоном вместо прозрачности."""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def generate_previews(blob):
+    """Построение недостающих превью блоба.
+
+    Превью уже существующих размеров не перестраиваются, поэтому
+    повторный запуск для того же содержимого ничего не делает.
+    """
+    if not supports_preview(blob.mime_type):
+        return 0
+
+    existing = set(blob.previews.values_list('size', flat=True))
+    missing = [size for size in PREVIEW_SIZES if size not in existing]
+    if not missing:
+        return 0
+
+    if blob.mime_type == PDF_MIME_TYPE:
+        source = _render_pdf_page(blob)
+    else:
+        source = _open_image(blob)
+    if source is None:
+        mark_preview_failed(blob.pk)
+        return 0
+
+    source = _to_rgb(source)
+
+    created = 0
+    for size in missing:
+        image = source.copy()
+        image.thumbnail((PREVIEW_SIZES[size],) * 2, Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=PREVIEW_QUALITY, optimize=True)
+
+        preview = FilePreview(blob=blob, size=size, width=image.width, height=image.height)
+        preview.image.save(f"{size}.jpg", ContentFile(buffer.getvalue()), save=False)
+        try:
+            with transaction.atomic():
+                preview.save()
+        except IntegrityError:
+            # Такое превью одновременно построила другая задача
+            preview.image.delete(save=False)
+            continue
+        created += 1
+
+    return created
@@ -0,0 +1,228 @@
+import html
+import logging
+import re
+import shutil
+import subprocess
+import tempfile
+import zipfile
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Left, NullIf, Replace
+
+from .models import FileBlob
+
+logger = logging.getLogger('app')
+
+# Конфигурация полнотекстового поиска PostgreSQL
+SEARCH_CONFIG = 'russian'
+
+# Максимальная длина извлеченного текста (в символах);
+# tsvector в PostgreSQL ограничен 1 МБ
+SEARCH_TEXT_MAX_LENGTH = 200000
+
+# Длина начала текста, по которому строится фрагмент с совпадениями
+SEARCH_HEADLINE_MAX_LENGTH = 50000
+
+# Максимальный объем распакованного XML офисного документа (в байтах)
+OFFICE_XML_MAX_SIZE = 16 * 1024 * 1024
+
+# Размер блока чтения частей офисного документа
+OFFICE_READ_SIZE = 64 * 1024
+
+# Количество первых страниц PDF, из которых извлекается текст
+PDF_TEXT_MAX_PAGES = 50
+
+# Ограничение времени извлечения текста из PDF (в секундах)
+PDF_TEXT_TIMEOUT = 120
+
+# Файлы внутри офисных документов, содержащие текст
+OFFICE_TEXT_MEMBERS = re.compile(
+    r'^(word/document\.xml|word/(header|footer)\d*\.xml|xl/sharedStrings\.xml|'
+    r'ppt/slides/slide\d+\.xml|content\.xml)$'
+)
+
+# MIME типы офисных документов (OOXML и OpenDocument)
+OFFICE_MIME_TYPES = {
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'application/vnd.oasis.opendocument.text',
+    'application/vnd.oasis.opendocument.spreadsheet',
+    'application/vnd.oasis.opendocument.presentation',
+}
+
+XML_TAG_PATTERN = re.compile(r'<[^>]+>')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def supports_text_extraction(mime_type):
+    """Проверка, извлекается ли текст из содержимого с таким MIME типом."""
+    return bool(mime_type) and (
+        mime_type.startswith('text/')
+        or mime_type == 'application/pdf'
+        or mime_type in OFFICE_MIME_TYPES
+    )
+
+
+def schedule_text_extraction(blob):
+    """Постановка задачи извлечения текста после фиксации транзакции."""
+    if not supports_text_extraction(blob.mime_type):
+        return False
+
+    from .tasks import extract_file_text
+    blob_id = blob.pk
+    transaction.on_commit(lambda: extract_file_text.delay(blob_id))
+    return True
+
+
+def _extract_pdf_text(blob):
+    """Извлечение текста первых страниц PDF через pdftotext."""
+    pdftotext = shutil.which('pdftotext')
+    if pdftotext is None:
+        logger.warning("pdftotext не найден, текст PDF не извлекается")
+        return ''
+
+    with tempfile.NamedTemporaryFile(suffix='.pdf') as source:
+        with blob.content.open('rb') as f:
+            shutil.copyfileobj(f, source)
+        source.flush()
+
+        result = subprocess.run(
+            [pdftotext, '-enc', 'UTF-8', '-l', str(PDF_TEXT_MAX_PAGES), source.name, '-'],
+            check=True,
+            capture_output=True,
+            timeout=PDF_TEXT_TIMEOUT
+        )
+    return result.stdout.decode('utf-8', errors='ignore')
+
+
+def _read_member(archive, info, limit):
+    """Чтение части архива блоками, не больше limit байт."""
+    data = bytearray()
+    with archive.open(info) as member:
+        while len(data) < limit:
+            chunk = member.read(min(OFFICE_READ_SIZE, limit - len(data)))
+            if not chunk:
+                break
+            data += chunk
+    return bytes(data)
+
+
+def _extract_office_text(blob):
+    """Извлечение текста из XML частей документа OOXML или OpenDocument.
+
+    Суммарный объем распакованных частей ограничен OFFICE_XML_MAX_SIZE:
+    части, размер которых по заголовку архива превышает остаток, не читаются,
+    а чтение остальных прекращается на границе лимита.
+    """
+    parts = []
+    remaining = OFFICE_XML_MAX_SIZE
+    with blob.content.open('rb') as f:
+        try:
+            archive = zipfile.ZipFile(f)
+        except zipfile.BadZipFile:
+            return ''
+
+        with archive:
+            for info in sorted(archive.infolist(), key=lambda item: item.filename):
+                if not OFFICE_TEXT_MEMBERS.match(info.filename):
+                    continue
+                if info.file_size > remaining:
+                    logger.warning(f"Часть {info.filename} блоба {blob.pk} превышает лимит и пропущена")
+                    continue
+
+                data = _read_member(archive, info, remaining)
+                remaining -= len(data)
+                xml = data.decode('utf-8', errors='ignore')
+                parts.append(html.unescape(XML_TAG_PATTERN.sub(' ', xml)))
+    return ' '.join(parts)
+
+
+def _extract_plain_text(blob):
+    """Чтение текстового файла в UTF-8 или Windows-1251."""
+    with blob.content.open('rb') as f:
+        data = f.read(SEARCH_TEXT_MAX_LENGTH * 4)
+    try:
+        return data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data.decode('cp1251', errors='ignore')
+
+
+def extract_text(blob):
+    """Извлечение текста содержимого блоба для поиска."""
+    if blob.mime_type == 'application/pdf':
+        text = _extract_pdf_text(blob)
+    elif blob.mime_type in OFFICE_MIME_TYPES:
+        text = _extract_office_text(blob)
+    elif blob.mime_type and blob.mime_type.startswith('text/'):
+        text = _extract_plain_text(blob)
+    else:
+        text = ''
+
+    text = WHITESPACE_PATTERN.sub(' ', text).strip()
+    # Нулевой символ не допускается в текстовых полях PostgreSQL
+    return text.replace('\x00', '')[:SEARCH_TEXT_MAX_LENGTH]
+
+
+def update_search_vectors(queryset):
+    """Пересчет поисковых векторов файлов по названию, описанию и тексту.
+
+    Вектор строится одним UPDATE на стороне базы данных, текст содержимого
+    берется подзапросом из блоба. Вне PostgreSQL векторы не используются,
+    и пересчет пропускается.
+    """
+    if connection.vendor != 'postgresql':
+        return 0
+
+    blob_text = FileBlob.objects.filter(pk=OuterRef('blob_id')).order_by().values('text_content')[:1]
+    vector = (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+        + SearchVector(Subquery(blob_text), weight='C', config=SEARCH_CONFIG)
+    )
+    return queryset.update(search_vector=vector)
+
+
+def _escape_html(expression):
+    """Экранирование специальных символов HTML на стороне базы данных."""
+    for char, entity in [('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;')]:
+        expression = Replace(expression, Value(char), Value(entity))
+    return expression
+
+
+def search_files(queryset, text):
+    """Поиск файлов с ранжированием и фрагментами текста.
+
+    В PostgreSQL поиск идет по поисковому вектору с GIN индексом,
+    результаты упорядочиваются по релевантности, а фрагмент с
+    совпадениями строится из описания или извлеченного текста.
+    Текст фрагмента экранируется, поэтому его можно выводить как HTML:
+    разметкой в нем являются только теги <mark>.
+    Вне PostgreSQL выполняется поиск по подстроке.
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.filter(
+            Q(title__icontains=text) |
+            Q(description__icontains=text) |
+            Q(blob__text_content__icontains=text)
+        )
+
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    document = _escape_html(Left(
+        Coalesce(NullIf('blob__text_content', Value('')), 'description'),
+        SEARCH_HEADLINE_MAX_LENGTH
+    ))
+
+    return queryset.filter(search_vector=query).annotate(
+        search_rank=SearchRank(F('search_vector'), query),
+        search_snippet=SearchHeadline(
+            document,
+            query,
+            config=SEARCH_CONFIG,
+            start_sel='<mark>',
+            stop_sel='</mark>',
+            max_fragments=2
+        )
+    ).order_by('-search_rank', '-created_at')
@@ -1,12 +1,15 @@
-import magic
-import hashlib
+import os
 from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 
 from .models import (
     FileCategory, File, FileAccess, FileVerification,
-    FileVersion, FileDownloadHistory
+    FileVersion, FileDownloadHistory, UploadSession
 )
+from .blobs import acquire_blob, retain_blob, release_blob
+from .uploadhandlers import describe_upload
+from .uploads import UPLOAD_MAX_SIZE
 
 
 class FileCategorySerializer(serializers.ModelSerializer):
@@ -91,10 +94,10 @@ class FileVersionSerializer(serializers.ModelSerializer):
     class Meta:
         model = FileVersion
         fields = [
-            'id', 'file', 'file_content', 'version_number',
+            'id', 'file', 'file_content', 'original_filename', 'version_number',
             'created_by', 'comment', 'created_at', 'created_by_details'
         ]
-        read_only_fields = ['created_at', 'version_number']
+        read_only_fields = ['original_filename', 'created_at', 'version_number']
 
     def get_created_by_details(self, obj):
         """Получение информации о пользователе, создавшем версию."""
@@ -118,6 +121,14 @@ class FileVersionSerializer(serializers.ModelSerializer):
         # Устанавливаем номер версии
         validated_data['version_number'] = version_number
 
+        # Содержимое сохраняется один раз на контрольную сумму
+        content = validated_data['file_content']
+        checksum, mime_type, file_size = describe_upload(content)
+        blob = acquire_blob(content, checksum, mime_type, file_size)
+        validated_data['file_content'] = blob.content.name
+        validated_data['original_filename'] = os.path.basename(content.name)
+        validated_data['blob'] = blob
+
         return super().create(validated_data)
 
 
@@ -133,13 +144,15 @@ class FileSerializer(serializers.ModelSerializer):
     class Meta:
         model = File
         fields = [
-            'id', 'title', 'description', 'file', 'file_size',
+            'id', 'title', 'description', 'file', 'original_filename', 'file_size',
             'file_type', 'mime_type', 'category', 'access_level',
             'owner', 'created_at', 'updated_at', 'checksum',
             'category_details', 'owner_details', 'access_rights',
             'verifications', 'versions'
         ]
-        read_only_fields = ['file_size', 'mime_type', 'checksum', 'created_at', 'updated_at']
+        read_only_fields = [
+            'original_filename', 'file_size', 'mime_type', 'checksum', 'created_at', 'updated_at'
+        ]
 
     def get_owner_details(self, obj):
         """Получение информации о владельце файла."""
@@ -153,29 +166,29 @@ class FileSerializer(serializers.ModelSerializer):
         """Создание нового файла с дополнительной обработкой."""
         file = validated_data.get('file')
 
-        # Определяем MIME тип файла
-        mime = magic.Magic(mime=True)
-        mime_type = mime.from_buffer(file.read())
-        file.seek(0)  # Сбрасываем указатель чтения
+        # Контрольная сумма, MIME тип и размер вычислены при приеме файла
+        checksum, mime_type, file_size = describe_upload(file)
 
-        # Рассчитываем контрольную сумму
-        sha256 = hashlib.sha256()
-        for chunk in file.chunks():
-            sha256.update(chunk)
-        checksum = sha256.hexdigest()
+        # Повторная загрузка того же содержимого не записывает его снова
+        blob = acquire_blob(file, checksum, mime_type, file_size)
 
         # Устанавливаем дополнительные поля
+        validated_data['file'] = blob.content.name
+        validated_data['original_filename'] = os.path.basename(file.name)
+        validated_data['blob'] = blob
         validated_data['mime_type'] = mime_type
         validated_data['checksum'] = checksum
-        validated_data['file_size'] = file.size
+        validated_data['file_size'] = file_size
 
         # Создаем экземпляр файла
         file_instance = super().create(validated_data)
 
-        # Создаем первую версию файла
+        # Первая версия ссылается на тот же блоб
         FileVersion.objects.create(
             file=file_instance,
-            file_content=file,
+            file_content=blob.content.name,
+            original_filename=file_instance.original_filename,
+            blob=retain_blob(blob),
             version_number=1,
             created_by=validated_data['owner'],
             comment="Первая версия"
@@ -183,6 +196,88 @@ class FileSerializer(serializers.ModelSerializer):
 
         return file_instance
 
+    def update(self, instance, validated_data):
+        """Обновление файла с заменой блоба при загрузке нового содержимого."""
+        file = validated_data.get('file')
+        if file is None:
+            return super().update(instance, validated_data)
+
+        checksum, mime_type, file_size = describe_upload(file)
+        blob = acquire_blob(file, checksum, mime_type, file_size)
+        previous_blob_id = instance.blob_id
+
+        validated_data['file'] = blob.content.name
+        validated_data['original_filename'] = os.path.basename(file.name)
+        validated_data['blob'] = blob
+        validated_data['mime_type'] = mime_type
+        validated_data['checksum'] = checksum
+        validated_data['file_size'] = file_size
+
+        instance = super().update(instance, validated_data)
+
+        if previous_blob_id:
+            release_blob(previous_blob_id)
+
+        return instance
+
+
+class FileListSerializer(serializers.ModelSerializer):
+    """Компактный сериализатор файла для списков.
+
+    Ожидает queryset с select_related('owner', 'category') и аннотациями
+    latest_version и verification_status. При поиске добавляются
+    релевантность и фрагмент текста с совпадениями.
+    """
+
+    owner_name = serializers.SerializerMethodField(read_only=True)
+    category_name = serializers.CharField(source='category.name', read_only=True, default=None)
+    latest_version = serializers.IntegerField(read_only=True)
+    verification_status = serializers.CharField(read_only=True)
+    search_rank = serializers.FloatField(read_only=True, default=None)
+    search_snippet = serializers.CharField(read_only=True, default=None)
+
+    class Meta:
+        model = File
+        fields = [
+            'id', 'title', 'file_type', 'file_size', 'mime_type', 'access_level',
+            'owner', 'owner_name', 'category', 'category_name',
+            'checksum', 'latest_version', 'verification_status', 'created_at', 'updated_at',
+            'search_rank', 'search_snippet'
+        ]
+        read_only_fields = fields
+
+    def get_owner_name(self, obj):
+        """Получение имени владельца файла."""
+        return obj.owner.get_full_name()
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """Сериализатор для модели UploadSession."""
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'filename', 'total_size', 'offset', 'status',
+            'title', 'description', 'file_type', 'category', 'access_level',
+            'file', 'created_at', 'updated_at', 'expires_at'
+        ]
+        read_only_fields = ['offset', 'status', 'file', 'created_at', 'updated_at', 'expires_at']
+
+    def validate_filename(self, value):
+        """Имя файла без пути, переданного клиентом."""
+        filename = os.path.basename(value.replace('\\', '/'))
+        if not filename:
+            raise serializers.ValidationError(_("Некорректное имя файла"))
+        return filename
+
+    def validate_total_size(self, value):
+        """Проверка размера загружаемого файла."""
+        if value <= 0:
+            raise serializers.ValidationError(_("Размер файла должен быть больше нуля"))
+        if value > UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(_("Размер файла превышает допустимый"))
+        return value
+
 
 class FileDownloadHistorySerializer(serializers.ModelSerializer):
     """Сериализатор для модели FileDownloadHistory."""
@@ -0,0 +1,103 @@
+from celery import shared_task
+
+from core.models import SystemLog
+from .models import File, FileBlob
+from .previews import generate_previews, mark_preview_failed
+from .search import extract_text, update_search_vectors
+from .uploads import cleanup_expired_sessions
+
+
+@shared_task
+def cleanup_upload_sessions():
+    """Отмена заброшенных сессий загрузки и удаление их временных файлов."""
+    try:
+        aborted = cleanup_expired_sessions()
+
+        return {
+            'status': 'success',
+            'aborted': aborted
+        }
+
+    except Exception as e:
+        # Логируем ошибку
+        error_message = str(e)
+        SystemLog.objects.create(
+            level=SystemLog.LogLevel.ERROR,
+            module='file_management',
+            message=f"Ошибка при очистке сессий загрузки: {error_message}"
+        )
+
+        return {
+            'status': 'error',
+            'error': error_message
+        }
+
+
+@shared_task
+def generate_file_previews(blob_id):
+    """Построение превью для содержимого блоба."""
+    try:
+        blob = FileBlob.objects.filter(pk=blob_id).first()
+        if blob is None:
+            return {
+                'status': 'skipped'
+            }
+
+        created = generate_previews(blob)
+
+        return {
+            'status': 'success',
+            'previews': created
+        }
+
+    except Exception as e:
+        # Повторный запрос превью не ставит задачу снова
+        mark_preview_failed(blob_id)
+
+        # Логируем ошибку
+        error_message = str(e)
+        SystemLog.objects.create(
+            level=SystemLog.LogLevel.ERROR,
+            module='file_management',
+            message=f"Ошибка при построении превью блоба {blob_id}: {error_message}"
+        )
+
+        return {
+            'status': 'error',
+            'error': error_message
+        }
+
+
+@shared_task
+def extract_file_text(blob_id):
+    """Извлечение текста содержимого блоба и обновление поисковых векторов файлов."""
+    try:
+        blob = FileBlob.objects.filter(pk=blob_id).first()
+        if blob is None:
+            return {
+                'status': 'skipped'
+            }
+
+        text = extract_text(blob)
+        FileBlob.objects.filter(pk=blob_id).update(text_content=text, text_extracted=True)
+        updated = update_search_vectors(File.objects.filter(blob_id=blob_id))
+
+        return {
+            'status': 'success',
+            'length': len(text),
+            'files': updated
+        }
+
+    except Exception as e:
+        # Логируем ошибку
+        error_message = str(e)
+        SystemLog.objects.create(
+            level=SystemLog.LogLevel.ERROR,
+            module='file_management',
+            message=f"Ошибка при извлечении текста блоба {blob_id}: {error_message}"
+        )
+
+        return {
+            'status': 'error',
+            'error': error_message
+        }
@@ -0,0 +1,108 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from .models import FileCategory, File, FileAccess, FileVerification, FileVersion
+from .views import FileViewSet
+
+User = get_user_model()
+
+
+class FileViewSetQueryCountTests(TestCase):
+    """Количество запросов списка и карточки файла не зависит от числа объектов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@example.com', password='password', first_name='Иван', last_name='Петров'
+        )
+        cls.owner = User.objects.create_user(
+            email='owner@example.com', password='password', first_name='Анна', last_name='Иванова'
+        )
+        cls.reviewer = User.objects.create_user(
+            email='reviewer@example.com', password='password', first_name='Олег', last_name='Смирнов'
+        )
+        cls.category = FileCategory.objects.create(name='Протоколы')
+
+        access_levels = [File.AccessLevel.PUBLIC, File.AccessLevel.RESTRICTED]
+        cls.files = []
+        for index in range(20):
+            file_obj = cls._create_file(f'Документ {index}', access_levels[index % 2])
+            if file_obj.access_level == File.AccessLevel.RESTRICTED:
+                FileAccess.objects.create(
+                    file=file_obj, user=cls.user, permission_type=FileAccess.PermissionType.VIEW
+                )
+            cls.files.append(file_obj)
+
+        # Файл с несколькими версиями, верификациями и выданными правами
+        cls.detailed = cls.files[1]
+        for version_number in range(2, 5):
+            FileVersion.objects.create(
+                file=cls.detailed,
+                file_content=f'documents/document/{version_number}.pdf',
+                version_number=version_number,
+                created_by=cls.owner
+            )
+        for status in [FileVerification.VerificationStatus.REJECTED, FileVerification.VerificationStatus.APPROVED]:
+            FileVerification.objects.create(
+                file=cls.detailed, requested_by=cls.owner, verified_by=cls.reviewer, status=status
+            )
+        for permission_type in [FileAccess.PermissionType.EDIT, FileAccess.PermissionType.DELETE]:
+            FileAccess.objects.create(file=cls.detailed, user=cls.reviewer, permission_type=permission_type)
+
+    @classmethod
+    def _create_file(cls, title, access_level):
+        """Файл с первой версией и запросом на верификацию."""
+        file_obj = File.objects.create(
+            title=title,
+            file='documents/document/source.pdf',
+            original_filename=f'{title}.pdf',
+            file_size=1024,
+            mime_type='application/pdf',
+            category=cls.category,
+            access_level=access_level,
+            owner=cls.owner
+        )
+        FileVersion.objects.create(
+            file=file_obj,
+            file_content='documents/document/source.pdf',
+            version_number=1,
+            created_by=cls.owner
+        )
+        FileVerification.objects.create(file=file_obj, requested_by=cls.owner)
+        return file_obj
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+
+    def _get(self, actions, **kwargs):
+        request = self.factory.get('/api/files/')
+        force_authenticate(request, user=self.user)
+        response = FileViewSet.as_view(actions)(request, **kwargs)
+        response.render()
+        return response
+
+    def test_list_page(self):
+        # Количество файлов для пагинации и страница файлов с аннотациями
+        with self.assertNumQueries(2):
+            response = self._get({'get': 'list'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 20)
+        self.assertEqual(len(response.data['results']), 20)
+
+        item = next(item for item in response.data['results'] if item['id'] == str(self.detailed.pk))
+        self.assertEqual(item['latest_version'], 4)
+        self.assertEqual(item['owner_name'], self.owner.get_full_name())
+        self.assertEqual(item['category_name'], self.category.name)
+
+    def test_retrieve_with_related_objects(self):
+        # Файл с владельцем и категорией, затем права,
+        # верификации и версии вместе с пользователями
+        with self.assertNumQueries(4):
+            response = self._get({'get': 'retrieve'}, pk=str(self.detailed.pk))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['versions']), 4)
+        self.assertEqual(len(response.data['verifications']), 3)
+        self.assertEqual(len(response.data['access_rights']), 3)
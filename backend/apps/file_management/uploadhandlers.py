@@ -0,0 +1,74 @@
+import hashlib
+
+import magic
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+# Количество начальных байт файла, по которым определяется MIME тип
+MIME_SNIFF_SIZE = 8 * 1024
+
+
+def detect_mime_type(head):
+    """Определение MIME типа по начальным байтам файла."""
+    return magic.Magic(mime=True).from_buffer(head)
+
+
+class HashingFileUploadHandler(TemporaryFileUploadHandler):
+    """Обработчик загрузки, записывающий файл на диск за один проход.
+
+    Во время приема порций вычисляются SHA-256 и размер, а начальные байты
+    сохраняются для определения MIME типа. В памяти одновременно находится
+    не больше одной порции, а временный файл затем перемещается
+    в хранилище без повторного копирования.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+        self.head = b''
+
+    def receive_data_chunk(self, raw_data, start):
+        self.sha256.update(raw_data)
+        if len(self.head) < MIME_SNIFF_SIZE:
+            self.head += raw_data[:MIME_SNIFF_SIZE - len(self.head)]
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.checksum = self.sha256.hexdigest()
+        file.detected_mime_type = detect_mime_type(self.head)
+        return file
+
+
+def describe_upload(file):
+    """Контрольная сумма, MIME тип и размер загруженного файла.
+
+    Использует значения, вычисленные HashingFileUploadHandler, а для файлов,
+    принятых другими обработчиками, читает файл порциями.
+    """
+    checksum = getattr(file, 'checksum', None)
+    mime_type = getattr(file, 'detected_mime_type', None)
+
+    if checksum is None or mime_type is None:
+        file.seek(0)
+        mime_type = detect_mime_type(file.read(MIME_SNIFF_SIZE))
+        file.seek(0)
+
+        sha256 = hashlib.sha256()
+        for chunk in file.chunks():
+            sha256.update(chunk)
+        checksum = sha256.hexdigest()
+        file.seek(0)
+
+    return checksum, mime_type, file.size
+
+
+class StreamingUploadMixin:
+    """Примесь представления, принимающая файлы через HashingFileUploadHandler.
+
+    Обработчики заменяются до разбора тела запроса, поэтому загрузка
+    не проходит через буфер в памяти.
+    """
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [HashingFileUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
@@ -0,0 +1,244 @@
+import datetime
+import fcntl
+import hashlib
+import os
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.files import File as DjangoFile
+from django.db import transaction
+from django.utils import timezone
+
+from .blobs import acquire_blob, retain_blob
+from .models import File, FileBlob, FileVersion, UploadSession
+from .uploadhandlers import MIME_SNIFF_SIZE, detect_mime_type
+
+# Каталог незавершенных загрузок относительно MEDIA_ROOT.
+# Находится в том же хранилище, чтобы готовый файл перемещался без копирования.
+UPLOAD_SESSION_DIR = os.path.join('uploads', 'incomplete')
+
+# Время жизни сессии без новых частей
+UPLOAD_SESSION_TTL = datetime.timedelta(hours=24)
+
+# Максимальный размер одной части: часть должна успевать загрузиться
+# за время таймаута nginx даже на медленной сети
+UPLOAD_CHUNK_MAX_SIZE = 16 * 1024 * 1024
+
+# Максимальный размер файла, загружаемого по частям
+UPLOAD_MAX_SIZE = 4 * 1024 * 1024 * 1024
+
+# Размер блока чтения тела запроса
+UPLOAD_READ_SIZE = 64 * 1024
+
+# Количество сессий, состояние хэширования которых хранится в процессе
+UPLOAD_HASHERS_MAX = 64
+
+# Состояние хэширования сессий в текущем процессе: id -> (смещение, sha256).
+# Если часть пришла в другой процесс, состояние восстанавливается
+# повторным чтением уже полученных байт. Сессии, завершенные в другом
+# процессе, вытесняются давно не использованными.
+_hashers = OrderedDict()
+
+
+class UploadConflict(Exception):
+    """Смещение части не совпадает с количеством полученных байт."""
+
+
+class UploadLocked(Exception):
+    """Часть этой сессии уже загружается другим запросом."""
+
+
+class _SessionFile(DjangoFile):
+    """Файл сессии, который хранилище может переместить вместо копирования."""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def session_path(session):
+    """Путь к временному файлу сессии."""
+    return os.path.join(settings.MEDIA_ROOT, UPLOAD_SESSION_DIR, f"{session.id}.part")
+
+
+def create_session(owner, **fields):
+    """Создание сессии загрузки и пустого временного файла."""
+    session = UploadSession.objects.create(
+        owner=owner,
+        expires_at=timezone.now() + UPLOAD_SESSION_TTL,
+        **fields
+    )
+    path = session_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    return session
+
+
+def _hasher_at(session, f):
+    """Хэш полученных байт сессии, при необходимости пересчитанный по файлу."""
+    state = _hashers.get(session.id)
+    if state is not None and state[0] == session.offset:
+        # Копия не дает недописанной части испортить сохраненное состояние
+        return state[1].copy()
+
+    sha256 = hashlib.sha256()
+    f.seek(0)
+    remaining = session.offset
+    while remaining:
+        chunk = f.read(min(UPLOAD_READ_SIZE, remaining))
+        if not chunk:
+            break
+        sha256.update(chunk)
+        remaining -= len(chunk)
+    return sha256
+
+
+def _remember_hasher(session, sha256):
+    """Сохранение состояния хэширования сессии с вытеснением старых."""
+    _hashers[session.id] = (session.offset, sha256)
+    _hashers.move_to_end(session.id)
+    while len(_hashers) > UPLOAD_HASHERS_MAX:
+        _hashers.popitem(last=False)
+
+
+def append_chunk(session, offset, stream, length):
+    """Дозапись части во временный файл сессии.
+
+    Часть принимается только с текущего смещения. Данные читаются из тела
+    запроса блоками и сразу пишутся в файл и в хэш. Байты после
+    сохраненного смещения, оставшиеся от прерванной части, отбрасываются.
+    """
+    if offset != session.offset:
+        raise UploadConflict()
+
+    with open(session_path(session), 'r+b') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadLocked()
+
+        # Смещение могло измениться, пока ожидалась блокировка
+        session.refresh_from_db(fields=['offset', 'status'])
+        if offset != session.offset:
+            raise UploadConflict()
+
+        sha256 = _hasher_at(session, f)
+        f.seek(session.offset)
+        f.truncate()
+
+        received = 0
+        while received < length:
+            block = stream.read(min(UPLOAD_READ_SIZE, length - received))
+            if not block:
+                break
+            f.write(block)
+            sha256.update(block)
+            received += len(block)
+        f.flush()
+        os.fsync(f.fileno())
+
+        session.offset += received
+        session.expires_at = timezone.now() + UPLOAD_SESSION_TTL
+        session.save(update_fields=['offset', 'expires_at', 'updated_at'])
+        # Состояние публикуется только после сохранения смещения
+        _remember_hasher(session, sha256)
+
+    return received
+
+
+def finalize_session(session):
+    """Превращение полностью полученной загрузки в обычный файл.
+
+    Контрольная сумма берется из накопленного хэша, для MIME типа
+    читаются только начальные байты, а в хранилище блобов перемещается
+    жесткая ссылка на временный файл. Сам временный файл удаляется
+    только после фиксации транзакции, поэтому при ошибке сессию можно
+    завершить повторно, а сохраненное для нее содержимое удаляется.
+    """
+    path = session_path(session)
+
+    with open(path, 'rb') as f:
+        checksum = _hasher_at(session, f).hexdigest()
+        f.seek(0)
+        mime_type = detect_mime_type(f.read(MIME_SNIFF_SIZE))
+
+    link_path = f"{path}.finalize"
+    if os.path.exists(link_path):
+        os.remove(link_path)
+    os.link(path, link_path)
+
+    blob = None
+    try:
+        with transaction.atomic():
+            with open(link_path, 'rb') as f:
+                blob = acquire_blob(_SessionFile(f, name=session.filename), checksum, mime_type, session.total_size)
+
+            file_instance = File.objects.create(
+                title=session.title,
+                description=session.description,
+                file=blob.content.name,
+                original_filename=session.filename,
+                blob=blob,
+                file_size=session.total_size,
+                file_type=session.file_type,
+                mime_type=mime_type,
+                category=session.category,
+                access_level=session.access_level,
+                owner=session.owner,
+                checksum=checksum
+            )
+
+            FileVersion.objects.create(
+                file=file_instance,
+                file_content=blob.content.name,
+                original_filename=session.filename,
+                blob=retain_blob(blob),
+                version_number=1,
+                created_by=session.owner,
+                comment="Первая версия"
+            )
+
+            session.status = UploadSession.SessionStatus.COMPLETED
+            session.file = file_instance
+            session.save(update_fields=['status', 'file', 'updated_at'])
+    except Exception:
+        # Ссылки на блоб откатились вместе с точкой сохранения;
+        # содержимое нового блоба без строки в базе больше не нужно
+        if blob is not None and not FileBlob.objects.filter(pk=blob.pk).exists():
+            blob.content.delete(save=False)
+        raise
+    finally:
+        # Такое содержимое уже было в хранилище, ссылка не понадобилась
+        if os.path.exists(link_path):
+            os.remove(link_path)
+
+    def remove_session_file():
+        if os.path.exists(path):
+            os.remove(path)
+        _hashers.pop(session.id, None)
+
+    transaction.on_commit(remove_session_file)
+    return file_instance
+
+
+def abort_session(session):
+    """Отмена загрузки и удаление временного файла."""
+    path = session_path(session)
+    if os.path.exists(path):
+        os.remove(path)
+    _hashers.pop(session.id, None)
+
+    session.status = UploadSession.SessionStatus.ABORTED
+    session.save(update_fields=['status', 'updated_at'])
+
+
+def cleanup_expired_sessions(now=None):
+    """Отмена активных сессий, в которые давно не приходили части."""
+    expired = UploadSession.objects.filter(
+        status=UploadSession.SessionStatus.ACTIVE,
+        expires_at__lt=now or timezone.now()
+    )
+    count = 0
+    for session in expired.iterator():
+        abort_session(session)
+        count += 1
+    return count
@@ -3,7 +3,8 @@ from rest_framework.routers import DefaultRouter
 
 from .views import (
     FileCategoryViewSet, FileViewSet, FileAccessViewSet,
-    FileVerificationViewSet, FileVersionViewSet, FileDownloadHistoryViewSet
+    FileVerificationViewSet, FileVersionViewSet, FileDownloadHistoryViewSet,
+    signed_download
 )
 
 # Создаем роутер
@@ -17,6 +18,9 @@ router.register(r'downloads', FileDownloadHistoryViewSet)
 
 # Определяем URL-паттерны
 urlpatterns = [
+    # Скачивание по подписанной ссылке без аутентификации
+    path('signed/<path:path>', signed_download, name='file-signed-download'),
+
     # Включаем маршруты из роутера
     path('', include(router.urls)),
 ]
\ No newline at end of file
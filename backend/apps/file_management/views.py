@@ -1,23 +1,79 @@
-from django.db.models import Q
-from django.http import FileResponse, Http404
+import datetime
+import time
+from urllib.parse import urlencode
+
+from django.db import transaction
+from django.db.models import OuterRef, Prefetch, Q, Subquery
+from django.core.exceptions import ValidationError
+from django.db.models.fields.files import FieldFile
+from django.http import Http404, HttpResponseForbidden
+from django.urls import reverse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from django.views.decorators.http import require_safe
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
+from core.utils import get_client_ip
 from .models import (
     FileCategory, File, FileAccess, FileVerification,
-    FileVersion, FileDownloadHistory
+    FileVersion, FileDownloadHistory, FileBlob, FilePreview, UploadSession
 )
 from .serializers import (
-    FileCategorySerializer, FileSerializer, FileAccessSerializer,
+    FileCategorySerializer, FileSerializer, FileListSerializer, FileAccessSerializer,
     FileVerificationSerializer, FileVersionSerializer,
-    FileDownloadHistorySerializer
+    FileDownloadHistorySerializer, UploadSessionSerializer
 )
 from .permissions import (
     IsFileOwner, HasFileAccess, CanVerifyFile
 )
+from .access import visible_files_q
+from .downloads import file_response, sign_download, verify_download
+from .previews import request_previews, supports_preview
+from .search import search_files
+from .uploadhandlers import StreamingUploadMixin
+from .uploads import (
+    UPLOAD_CHUNK_MAX_SIZE, UploadConflict, UploadLocked,
+    create_session, append_chunk, finalize_session, abort_session
+)
+
+# Время кэширования превью с контрольной суммой в адресе (в секундах)
+PREVIEW_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+@require_safe
+def signed_download(request, path):
+    """Скачивание файла по подписанной ссылке.
+
+    Ссылка проверяется только по подписи, без аутентификации и запросов
+    к базе данных, поэтому повторные скачивания и встраивания файла
+    почти не нагружают приложение, а при включенном X-Accel-Redirect
+    содержимое отдает nginx.
+    """
+    expires = request.GET.get('expires')
+    filename = request.GET.get('name', '')
+    if not verify_download(path, expires, request.GET.get('uid'), request.GET.get('signature'), filename):
+        return HttpResponseForbidden()
+
+    field_file = FieldFile(None, FileBlob._meta.get_field('content'), path)
+    try:
+        last_modified = field_file.storage.get_modified_time(path)
+    except (FileNotFoundError, NotImplementedError):
+        raise Http404(_("Файл не найден"))
+
+    response = file_response(
+        request,
+        field_file,
+        last_modified=last_modified,
+        filename=filename or None,
+        as_attachment=request.GET.get('inline') != '1'
+    )
+
+    # Браузер может повторно использовать файл, пока ссылка действует
+    max_age = max(int(expires) - int(time.time()), 0)
+    response['Cache-Control'] = f'private, max-age={max_age}'
+    return response
 
 
 class FileCategoryViewSet(viewsets.ModelViewSet):
@@ -36,7 +92,7 @@ class FileCategoryViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
 
 
-class FileViewSet(viewsets.ModelViewSet):
+class FileViewSet(StreamingUploadMixin, viewsets.ModelViewSet):
     """Представление для работы с файлами."""
 
     queryset = File.objects.all()
@@ -55,11 +111,10 @@ class FileViewSet(viewsets.ModelViewSet):
             # 1. Публичные файлы
             # 2. Свои файлы
             # 3. Файлы с разрешением на просмотр
-            queryset = File.objects.filter(
-                Q(access_level='public') |
-                Q(owner=user) |
-                Q(access_rights__user=user, access_rights__permission_type='view')
-            ).distinct()
+            queryset = File.objects.filter(visible_files_q(user))
+
+        # Поисковый вектор нужен только в условиях запроса
+        queryset = queryset.defer('search_vector')
 
         # Фильтрация по категории
         category = self.request.query_params.get('category')
@@ -76,21 +131,49 @@ class FileViewSet(viewsets.ModelViewSet):
         if access_level:
             queryset = queryset.filter(access_level=access_level)
 
-        # Поиск по названию или описанию
+        # Полнотекстовый поиск по названию, описанию и содержимому
         search = self.request.query_params.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) |
-                Q(description__icontains=search)
+            queryset = search_files(queryset, search)
+
+        if self.action == 'list':
+            # Для списка все поля берутся из одного запроса
+            latest_version = FileVersion.objects.filter(
+                file=OuterRef('pk')
+            ).order_by('-version_number').values('version_number')[:1]
+            latest_verification = FileVerification.objects.filter(
+                file=OuterRef('pk')
+            ).order_by('-requested_at').values('status')[:1]
+
+            queryset = queryset.select_related('owner', 'category').annotate(
+                latest_version=Subquery(latest_version),
+                verification_status=Subquery(latest_verification)
+            )
+        elif self.action == 'retrieve':
+            # Вложенные права, верификации и версии загружаются
+            # отдельными запросами вместе с пользователями
+            queryset = queryset.select_related('owner', 'category').prefetch_related(
+                Prefetch('access_rights', queryset=FileAccess.objects.select_related('user')),
+                Prefetch(
+                    'verifications',
+                    queryset=FileVerification.objects.select_related('requested_by', 'verified_by')
+                ),
+                Prefetch('versions', queryset=FileVersion.objects.select_related('created_by'))
             )
 
         return queryset
 
+    def get_serializer_class(self):
+        """Выбор сериализатора в зависимости от действия."""
+        if self.action == 'list':
+            return FileListSerializer
+        return super().get_serializer_class()
+
     def get_permissions(self):
         """Определение прав доступа."""
         if self.action in ['update', 'partial_update', 'destroy']:
             permission_classes = [permissions.IsAuthenticated, IsFileOwner]
-        elif self.action in ['download', 'download_version']:
+        elif self.action in ['download', 'download_version', 'signed_url', 'preview']:
             permission_classes = [permissions.IsAuthenticated, HasFileAccess]
         else:
             permission_classes = [permissions.IsAuthenticated]
@@ -105,17 +188,14 @@ class FileViewSet(viewsets.ModelViewSet):
         """Скачивание файла."""
         file_obj = self.get_object()
 
-        # Запись в историю скачиваний
-        FileDownloadHistory.objects.create(
-            file=file_obj,
-            user=request.user,
-            ip_address=request.META.get('REMOTE_ADDR'),
-            user_agent=request.META.get('HTTP_USER_AGENT', '')
+        response = file_response(
+            request,
+            file_obj.file,
+            etag=file_obj.checksum or None,
+            last_modified=file_obj.updated_at,
+            filename=file_obj.get_download_name()
         )
-
-        # Возвращение файла
-        response = FileResponse(file_obj.file)
-        response['Content-Disposition'] = f'attachment; filename="{file_obj.file.name.split("/")[-1]}"'
+        self._record_download(request, file_obj, response)
         return response
 
     @action(detail=True, methods=['get'])
@@ -125,23 +205,207 @@ class FileViewSet(viewsets.ModelViewSet):
         version_id = request.query_params.get('version_id')
 
         try:
-            version = FileVersion.objects.get(id=version_id, file=file_obj)
+            version = FileVersion.objects.select_related('blob').get(id=version_id, file=file_obj)
         except FileVersion.DoesNotExist:
             raise Http404(_("Версия файла не найдена"))
+        version.file = file_obj
+
+        response = file_response(
+            request,
+            version.file_content,
+            etag=version.blob.checksum if version.blob else None,
+            last_modified=version.created_at,
+            filename=version.get_download_name()
+        )
+        self._record_download(request, file_obj, response)
+        return response
+
+    @action(detail=True, methods=['get'])
+    def signed_url(self, request, pk=None):
+        """Выдача временной подписанной ссылки на скачивание файла или версии.
+
+        Скачивание по ссылке не проверяет права и не пишет историю,
+        поэтому запись в историю скачиваний делается при выдаче ссылки.
+        """
+        file_obj = self.get_object()
+        field_file = file_obj.file
+        filename = file_obj.get_download_name()
+
+        version_id = request.query_params.get('version_id')
+        if version_id:
+            try:
+                version = FileVersion.objects.get(id=version_id, file=file_obj)
+            except (FileVersion.DoesNotExist, ValueError, ValidationError):
+                raise Http404(_("Версия файла не найдена"))
+            version.file = file_obj
+            field_file = version.file_content
+            filename = version.get_download_name()
+
+        params = sign_download(field_file.name, request.user.id, filename)
+        url = reverse('file-signed-download', kwargs={'path': field_file.name})
 
-        # Запись в историю скачиваний
         FileDownloadHistory.objects.create(
             file=file_obj,
             user=request.user,
-            ip_address=request.META.get('REMOTE_ADDR'),
+            ip_address=get_client_ip(request) or None,
             user_agent=request.META.get('HTTP_USER_AGENT', '')
         )
 
-        # Возвращение файла
-        response = FileResponse(version.file_content)
-        response['Content-Disposition'] = f'attachment; filename="{version.file_content.name.split("/")[-1]}"'
+        return Response({
+            'url': request.build_absolute_uri(f"{url}?{urlencode(params)}"),
+            'expires_at': datetime.datetime.fromtimestamp(params['expires'], tz=datetime.timezone.utc).isoformat()
+        })
+
+    @action(detail=True, methods=['get'])
+    def preview(self, request, pk=None):
+        """Превью содержимого файла.
+
+        Если в параметре v передана текущая контрольная сумма файла, ответ
+        кэшируется браузером без ограничения: новое содержимое получит
+        другой адрес. Пока превью строится, возвращается 202, а если
+        построить его не удалось - 404.
+        """
+        file_obj = self.get_object()
+
+        size = request.query_params.get('size', FilePreview.PreviewSize.MEDIUM)
+        if size not in FilePreview.PreviewSize.values:
+            return Response(
+                {"detail": _("Неизвестный размер превью")},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        blob = file_obj.blob
+        if blob is None or not supports_preview(blob.mime_type):
+            raise Http404(_("Превью для этого файла недоступно"))
+
+        preview = FilePreview.objects.filter(blob=blob, size=size).first()
+        if preview is None:
+            if blob.preview_failed:
+                raise Http404(_("Не удалось построить превью для этого файла"))
+            request_previews(blob)
+            return Response(status=status.HTTP_202_ACCEPTED)
+
+        response = file_response(
+            request,
+            preview.image,
+            etag=f"{blob.checksum}-{size}",
+            last_modified=preview.created_at,
+            as_attachment=False
+        )
+        if request.query_params.get('v') == blob.checksum:
+            response['Cache-Control'] = f'private, max-age={PREVIEW_CACHE_MAX_AGE}, immutable'
+        else:
+            response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    def _record_download(self, request, file_obj, response):
+        """Запись в историю скачиваний.
+
+        Запросы продолжения (Range не с начала файла) и ответы без
+        содержимого не считаются отдельными скачиваниями.
+        """
+        if response.download_start != 0:
+            return
+
+        FileDownloadHistory.objects.create(
+            file=file_obj,
+            user=request.user,
+            ip_address=get_client_ip(request) or None,
+            user_agent=request.META.get('HTTP_USER_AGENT', '')
+        )
+
+    @action(detail=False, methods=['post'], url_path='uploads')
+    def create_upload(self, request):
+        """Создание сессии возобновляемой загрузки файла по частям."""
+        serializer = UploadSessionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        session = create_session(request.user, **serializer.validated_data)
+        return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+    def _get_upload_session(self, upload_id, for_update=False):
+        """Получение активной сессии загрузки текущего пользователя."""
+        queryset = UploadSession.objects.filter(
+            owner=self.request.user,
+            status=UploadSession.SessionStatus.ACTIVE
+        )
+        if for_update:
+            queryset = queryset.select_for_update()
+
+        try:
+            return queryset.get(id=upload_id)
+        except (UploadSession.DoesNotExist, ValueError, ValidationError):
+            raise Http404(_("Сессия загрузки не найдена"))
+
+    @action(detail=False, methods=['get', 'put', 'delete'], url_path=r'uploads/(?P<upload_id>[^/.]+)')
+    def upload(self, request, upload_id=None):
+        """Состояние загрузки, дозапись части или отмена загрузки.
+
+        Часть передается телом PUT-запроса, ее начало указывается
+        в заголовке Upload-Offset.
+        """
+        session = self._get_upload_session(upload_id)
+
+        if request.method == 'DELETE':
+            abort_session(session)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        if request.method == 'PUT':
+            try:
+                offset = int(request.headers.get('Upload-Offset', ''))
+                length = int(request.META.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                return Response(
+                    {'error': _("Не указано смещение части")},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            if length > UPLOAD_CHUNK_MAX_SIZE:
+                return Response(
+                    {'error': _("Часть превышает допустимый размер"), 'max_chunk_size': UPLOAD_CHUNK_MAX_SIZE},
+                    status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+                )
+
+            if offset + length > session.total_size:
+                return Response(
+                    {'error': _("Часть выходит за пределы файла")},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            try:
+                append_chunk(session, offset, request.stream, length)
+            except UploadConflict:
+                return Response(
+                    {'error': _("Смещение части не совпадает с полученными данными"), 'offset': session.offset},
+                    status=status.HTTP_409_CONFLICT
+                )
+            except UploadLocked:
+                return Response(
+                    {'error': _("Часть этой загрузки уже передается"), 'offset': session.offset},
+                    status=status.HTTP_409_CONFLICT
+                )
+
+        response = Response(UploadSessionSerializer(session).data)
+        response['Upload-Offset'] = str(session.offset)
         return response
 
+    @action(detail=False, methods=['post'], url_path=r'uploads/(?P<upload_id>[^/.]+)/finalize')
+    def finalize_upload(self, request, upload_id=None):
+        """Завершение загрузки и создание файла."""
+        with transaction.atomic():
+            session = self._get_upload_session(upload_id, for_update=True)
+
+            if session.offset != session.total_size:
+                return Response(
+                    {'error': _("Файл получен не полностью"), 'offset': session.offset},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            file_instance = finalize_session(session)
+
+        serializer = self.get_serializer(file_instance)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
     @action(detail=True, methods=['post'])
     def request_verification(self, request, pk=None):
         """Запрос на верификацию файла."""
@@ -264,7 +528,7 @@ class FileVerificationViewSet(viewsets.ModelViewSet):
             serializer.save()
 
 
-class FileVersionViewSet(viewsets.ModelViewSet):
+class FileVersionViewSet(StreamingUploadMixin, viewsets.ModelViewSet):
     """Представление для работы с версиями файлов."""
 
     queryset = FileVersion.objects.all()
@@ -281,10 +545,8 @@ class FileVersionViewSet(viewsets.ModelViewSet):
         else:
             # Пользователи видят версии файлов, к которым у них есть доступ
             queryset = FileVersion.objects.filter(
-                Q(file__owner=user) |
-                Q(file__access_level='public') |
-                Q(file__access_rights__user=user, file__access_rights__permission_type='view')
-            ).distinct()
+                visible_files_q(user, file_ref='file_id', prefix='file__')
+            )
 
         # Фильтрация по файлу
         file_id = self.request.query_params.get('file')
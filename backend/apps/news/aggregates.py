@@ -0,0 +1,132 @@
+import datetime
+
+from django.db import transaction
+from django.db.models import Count, Min
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from core.models import SystemSetting
+from .models import NewsView, NewsArticleHourlyViews
+
+# Шаг пересчета, ограничивающий объем одной выборки
+HOURLY_VIEWS_ROLLUP_STEP = datetime.timedelta(days=1)
+
+# Задержка закрытия часа: просмотры, зафиксированные сразу после границы
+# часа, должны успеть попасть в базу до его пересчета
+HOURLY_VIEWS_ROLLUP_LAG = datetime.timedelta(minutes=5)
+
+# Ключ настройки с началом первого еще не посчитанного часа
+HOURLY_VIEWS_WATERMARK_KEY = 'news.hourly_views_watermark'
+
+
+def hour_start(value):
+    """Начало часа для указанного времени."""
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def get_hourly_views_watermark():
+    """Время, до которого почасовые просмотры посчитаны полностью."""
+    setting = SystemSetting.objects.filter(key=HOURLY_VIEWS_WATERMARK_KEY).first()
+    if setting is None:
+        return None
+    return datetime.datetime.fromisoformat(setting.value)
+
+
+def set_hourly_views_watermark(value):
+    """Сохранение времени, до которого почасовые просмотры посчитаны."""
+    SystemSetting.objects.update_or_create(
+        key=HOURLY_VIEWS_WATERMARK_KEY,
+        defaults={
+            'value': value.isoformat(),
+            'description': 'Время, до которого просмотры новостей сведены по часам'
+        }
+    )
+
+
+def rollup_hourly_views(now=None):
+    """Инкрементальный пересчет почасовых просмотров статей по завершенным часам.
+
+    Час пересчитывается не раньше чем через HOURLY_VIEWS_ROLLUP_LAG после
+    его конца. Каждый шаг заменяет строки за свой интервал целиком и сдвигает
+    отметку в той же транзакции, поэтому повторный запуск безопасен.
+    """
+    end = hour_start((now or timezone.now()) - HOURLY_VIEWS_ROLLUP_LAG)
+
+    start = get_hourly_views_watermark()
+    if start is None:
+        first = NewsView.objects.aggregate(first=Min('viewed_at'))['first']
+        if first is None:
+            set_hourly_views_watermark(end)
+            return 0
+        start = hour_start(first)
+
+    created = 0
+    while start < end:
+        step_end = min(start + HOURLY_VIEWS_ROLLUP_STEP, end)
+
+        rows = NewsView.objects.filter(
+            viewed_at__gte=start,
+            viewed_at__lt=step_end
+        ).annotate(
+            hour=TruncHour('viewed_at')
+        ).values('article_id', 'hour').annotate(
+            views=Count('id'),
+            visitors=Count('ip_address', distinct=True)
+        ).order_by()
+
+        hourly = [
+            NewsArticleHourlyViews(
+                article_id=row['article_id'],
+                hour=row['hour'],
+                views_count=row['views'],
+                unique_visitors=row['visitors']
+            )
+            for row in rows
+        ]
+
+        with transaction.atomic():
+            NewsArticleHourlyViews.objects.filter(hour__gte=start, hour__lt=step_end).delete()
+            NewsArticleHourlyViews.objects.bulk_create(hourly, batch_size=1000)
+            set_hourly_views_watermark(step_end)
+
+        created += len(hourly)
+        start = step_end
+
+    return created
+
+
+def get_article_views_timeseries(article, start, end):
+    """Почасовые просмотры статьи за интервал, включая нулевые часы.
+
+    Посчитанные часы читаются из почасовой таблицы, а для часов после
+    отметки просмотры считаются по журналу только этой статьи.
+    """
+    start, end = hour_start(start), hour_start(end)
+    watermark = get_hourly_views_watermark() or start
+
+    counts = dict(
+        NewsArticleHourlyViews.objects.filter(
+            article=article,
+            hour__gte=start,
+            hour__lt=min(watermark, end + datetime.timedelta(hours=1))
+        ).values_list('hour', 'views_count')
+    )
+
+    if watermark <= end:
+        tail = NewsView.objects.filter(
+            article=article,
+            viewed_at__gte=max(watermark, start)
+        ).annotate(
+            hour=TruncHour('viewed_at')
+        ).values('hour').annotate(views=Count('id')).order_by()
+
+        for row in tail:
+            counts[row['hour']] = counts.get(row['hour'], 0) + row['views']
+
+    series = []
+    hour = start
+    while hour <= end:
+        series.append({'hour': hour.isoformat(), 'views': counts.get(hour, 0)})
+        hour += datetime.timedelta(hours=1)
+
+    return series
@@ -173,7 +173,33 @@ class NewsView(models.Model):
         verbose_name_plural = _('Просмотры новостей')
         ordering = ['-viewed_at']
         unique_together = ['article', 'user', 'ip_address', 'viewed_at']
+        indexes = [
+            models.Index(fields=['viewed_at']),
+        ]
 
     def __str__(self):
         user_str = self.user.email if self.user else 'Анонимный пользователь'
-        return f"Просмотр {self.article} пользователем {user_str}"
\ No newline at end of file
+        return f"Просмотр {self.article} пользователем {user_str}"
+
+
+class NewsArticleHourlyViews(models.Model):
+    """Модель почасового количества просмотров статьи."""
+
+    article = models.ForeignKey(
+        NewsArticle,
+        verbose_name=_('Статья'),
+        related_name='hourly_views',
+        on_delete=models.CASCADE
+    )
+    hour = models.DateTimeField(_('Час'))
+    views_count = models.PositiveIntegerField(_('Количество просмотров'), default=0)
+    unique_visitors = models.PositiveIntegerField(_('Уникальные посетители'), default=0)
+
+    class Meta:
+        verbose_name = _('Почасовые просмотры статьи')
+        verbose_name_plural = _('Почасовые просмотры статей')
+        ordering = ['article', 'hour']
+        unique_together = ['article', 'hour']
+
+    def __str__(self):
+        return f"{self.article} - {self.hour}: {self.views_count}"
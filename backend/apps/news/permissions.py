@@ -15,6 +15,16 @@ class IsNewsAuthorOrReadOnly(permissions.BasePermission):
         return obj.author == request.user or request.user.is_superuser
 
 
+class IsNewsEditor(permissions.BasePermission):
+    """
+    Разрешение, позволяющее только автору статьи и персоналу видеть её статистику.
+    """
+
+    def has_object_permission(self, request, view, obj):
+        # Проверяем, является ли пользователь автором или сотрудником редакции
+        return obj.author == request.user or request.user.is_staff or request.user.is_superuser
+
+
 class IsCommentAuthorOrReadOnly(permissions.BasePermission):
     """
     Разрешение, позволяющее только авторам комментария изменять его.
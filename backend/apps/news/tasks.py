@@ -0,0 +1,30 @@
+from celery import shared_task
+
+from core.models import SystemLog
+from .aggregates import rollup_hourly_views
+
+
+@shared_task
+def update_hourly_views():
+    """Плановый пересчет почасовых просмотров статей."""
+    try:
+        created = rollup_hourly_views()
+
+        return {
+            'status': 'success',
+            'rows': created
+        }
+
+    except Exception as e:
+        # Логируем ошибку
+        error_message = str(e)
+        SystemLog.objects.create(
+            level=SystemLog.LogLevel.ERROR,
+            module='news',
+            message=f"Ошибка при пересчете почасовых просмотров: {error_message}"
+        )
+
+        return {
+            'status': 'error',
+            'error': error_message
+        }
@@ -1,3 +1,4 @@
+from datetime import timedelta
 from django.db.models import Q, Count
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
@@ -5,12 +6,15 @@ from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
+from apps.analytics.ingestion import filter_event
+from core.utils import get_client_ip
 from .models import NewsCategory, NewsArticle, NewsTag, NewsComment, NewsView
 from .serializers import (
     NewsCategorySerializer, NewsArticleSerializer, NewsTagSerializer,
     NewsCommentSerializer, NewsViewSerializer
 )
-from .permissions import IsNewsAuthorOrReadOnly, IsCommentAuthorOrReadOnly
+from .permissions import IsNewsAuthorOrReadOnly, IsNewsEditor, IsCommentAuthorOrReadOnly
+from .aggregates import get_article_views_timeseries
 
 
 class NewsCategoryViewSet(viewsets.ModelViewSet):
@@ -66,6 +70,14 @@ class NewsArticleViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsNewsAuthorOrReadOnly]
     lookup_field = 'slug'
 
+    def get_permissions(self):
+        """Определение прав доступа."""
+        if self.action == 'views_timeseries':
+            permission_classes = [permissions.IsAuthenticated, IsNewsEditor]
+        else:
+            permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsNewsAuthorOrReadOnly]
+        return [permission() for permission in permission_classes]
+
     def get_queryset(self):
         """Фильтрация статей."""
         user = self.request.user
@@ -125,9 +137,11 @@ class NewsArticleViewSet(viewsets.ModelViewSet):
         article = self.get_object()
 
         # Учет просмотра, если пользователь не является автором
-        if request.user != article.author:
+        # и запрос не отброшен как трафик роботов или мониторинга
+        session = f"user:{request.user.pk}" if request.user.is_authenticated else ''
+        if request.user != article.author and filter_event(request, session) is None:
             # Получаем IP-адрес
-            ip_address = request.META.get('REMOTE_ADDR', '')
+            ip_address = get_client_ip(request)
             user_agent = request.META.get('HTTP_USER_AGENT', '')
 
             # Создаем запись о просмотре
@@ -145,6 +159,28 @@ class NewsArticleViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(article)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'])
+    def views_timeseries(self, request, slug=None):
+        """Получение почасовых просмотров статьи."""
+        article = self.get_object()
+
+        # По умолчанию показываем последнюю неделю, не больше 90 дней
+        try:
+            hours = int(request.query_params.get('hours', 168))
+        except ValueError:
+            hours = 168
+        hours = max(1, min(hours, 90 * 24))
+
+        end = timezone.now()
+        series = get_article_views_timeseries(article, end - timedelta(hours=hours - 1), end)
+
+        return Response({
+            'article': article.slug,
+            'hours': hours,
+            'total_views': sum(item['views'] for item in series),
+            'series': series
+        })
+
     @action(detail=False, methods=['get'])
     def popular(self, request):
         """Получение популярных статей."""
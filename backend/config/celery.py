@@ -25,10 +25,30 @@ app.conf.beat_schedule = {
         'task': 'apps.file_management.tasks.cleanup_old_files',
         'schedule': 86400.0 * 7,  # Once a week (in seconds)
     },
+    'cleanup-upload-sessions': {
+        'task': 'apps.file_management.tasks.cleanup_upload_sessions',
+        'schedule': 3600.0,  # Every hour (in seconds)
+    },
     'update-analytics': {
         'task': 'apps.analytics.tasks.update_analytics',
         'schedule': 3600.0,  # Every hour (in seconds)
     },
+    'update-sessions': {
+        'task': 'apps.analytics.tasks.update_sessions',
+        'schedule': 300.0,  # Every 5 minutes (in seconds)
+    },
+    'flush-activities': {
+        'task': 'apps.analytics.tasks.flush_activities',
+        'schedule': 10.0,  # Every 10 seconds
+    },
+    'update-news-hourly-views': {
+        'task': 'apps.news.tasks.update_hourly_views',
+        'schedule': 900.0,  # Every 15 minutes (in seconds)
+    },
+    'archive-analytics': {
+        'task': 'apps.analytics.tasks.archive_analytics',
+        'schedule': 86400.0,  # Once a day (in seconds)
+    },
 }
 
 
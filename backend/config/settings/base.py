@@ -54,6 +54,7 @@ LOCAL_APPS = [
 INSTALLED_APPS = DJANGO_APPS + THIRD_PARTY_APPS + LOCAL_APPS
 
 MIDDLEWARE = [
+    'apps.analytics.middleware.RequestLatencyMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -65,6 +66,8 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'defender.middleware.FailedLoginMiddleware',
     'axes.middleware.AxesMiddleware',
+    'apps.analytics.middleware.ActiveUserMiddleware',
+    'apps.analytics.middleware.ActivityCaptureMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -242,6 +245,38 @@ DEFENDER_LOGIN_FAILURE_LIMIT = 5
 DEFENDER_COOLOFF_TIME = 300  # 5 minutes
 DEFENDER_LOCKOUT_TEMPLATE = 'accounts/lockout.html'
 
+# Client IP
+# Заголовок с адресом клиента, который выставляет nginx (X-Real-IP).
+# Пустое значение - использовать REMOTE_ADDR без прокси.
+CLIENT_IP_HEADER = env('CLIENT_IP_HEADER', default='HTTP_X_REAL_IP')
+
+# Analytics ingestion filtering
+# Сети, трафик из которых всегда учитывается (например, внутренняя сеть больницы)
+ANALYTICS_IP_ALLOWLIST = env.list('ANALYTICS_IP_ALLOWLIST', default=[])
+# Сети, трафик из которых никогда не учитывается (мониторинг, проверки доступности)
+ANALYTICS_IP_DENYLIST = env.list('ANALYTICS_IP_DENYLIST', default=[])
+# Максимальное количество событий одной сессии в минуту
+ANALYTICS_SESSION_RATE_LIMIT = env.int('ANALYTICS_SESSION_RATE_LIMIT', default=60)
+
+# Analytics adaptive sampling
+ANALYTICS_SAMPLING_ENABLED = env.bool('ANALYTICS_SAMPLING_ENABLED', default=True)
+# Под нагрузкой сохраняется одно событие из N
+ANALYTICS_SAMPLING_RATE = env.int('ANALYTICS_SAMPLING_RATE', default=10)
+# Порог 95-го перцентиля времени ответа (мс)
+ANALYTICS_SAMPLING_P95_MS = env.int('ANALYTICS_SAMPLING_P95_MS', default=1000)
+# Порог суммарной длины очередей Redis
+ANALYTICS_SAMPLING_QUEUE_DEPTH = env.int('ANALYTICS_SAMPLING_QUEUE_DEPTH', default=1000)
+ANALYTICS_SAMPLING_QUEUES = env.list('ANALYTICS_SAMPLING_QUEUES', default=['celery', 'analytics:activity_buffer'])
+
+# File downloads
+# Отдача содержимого скачиваемых файлов через nginx (X-Accel-Redirect).
+# Django проверяет права и пишет историю, а байты отдает nginx.
+FILE_DOWNLOAD_ACCEL_REDIRECT = env.bool('FILE_DOWNLOAD_ACCEL_REDIRECT', default=False)
+# Внутренний location nginx, указывающий на каталог медиа-файлов
+FILE_DOWNLOAD_ACCEL_PREFIX = env('FILE_DOWNLOAD_ACCEL_PREFIX', default='/protected-media/')
+# Время действия подписанных ссылок на скачивание (в секундах)
+FILE_SIGNED_URL_TTL = env.int('FILE_SIGNED_URL_TTL', default=300)
+
 # Swagger settings
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
@@ -30,6 +30,9 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Без nginx скачиваемые файлы отдает Django
+FILE_DOWNLOAD_ACCEL_REDIRECT = False
+
 # Настройки для статических файлов
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 STATIC_URL = '/static/'
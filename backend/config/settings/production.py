@@ -32,6 +32,9 @@ DEFAULT_FROM_EMAIL = env('DEFAULT_FROM_EMAIL', default=EMAIL_HOST_USER)
 MEDIA_ROOT = '/var/www/media'
 MEDIA_URL = '/media/'
 
+# Скачиваемые файлы отдает nginx
+FILE_DOWNLOAD_ACCEL_REDIRECT = env.bool('FILE_DOWNLOAD_ACCEL_REDIRECT', default=True)
+
 # Настройки для статических файлов
 STATIC_ROOT = '/var/www/static'
 STATIC_URL = '/static/'
@@ -0,0 +1,20 @@
+import ipaddress
+
+from django.conf import settings
+
+
+def get_client_ip(request):
+    """IP-адрес клиента с учетом доверенного прокси.
+
+    nginx передает адрес клиента в заголовке, указанном в CLIENT_IP_HEADER;
+    REMOTE_ADDR за прокси содержит адрес самого nginx. Если заголовка нет
+    или в нем не IP-адрес, используется REMOTE_ADDR.
+    """
+    header = settings.CLIENT_IP_HEADER
+    if header:
+        value = request.META.get(header, '').strip()
+        try:
+            return str(ipaddress.ip_address(value))
+        except ValueError:
+            pass
+    return request.META.get('REMOTE_ADDR', '')